@@ -1,174 +1,279 @@
+import os
+import sys
 import cv2
 import numpy as np
-import mediapipe as mp
-
-# Initialize Mediapipe Hands module
-mpHands = mp.solutions.hands
-hands = mpHands.Hands(min_detection_confidence=0.8, min_tracking_confidence=0.8)
-mpDraw = mp.solutions.drawing_utils
-
-# Drawing variables
-brushThickness = 15
-eraserThickness = 50
-drawColor = (255, 0, 139)  # Default drawing color
-xp, yp = 0, 0  # Previous points
-imgCanvas = np.zeros((720, 1280, 3), np.uint8)  # Canvas for drawing
-
-# Tool variables
-currentTool = "Free Draw"  # Default tool
-startPoint = None  # Starting point for shapes (rectangle, circle, line)
-undoStack = []  # Stack to store canvas history for undo
-
-# Webcam setup
-cap = cv2.VideoCapture(0)
-cap.set(3, 1280)
-cap.set(4, 720)
-
-while True:
-    # Capture frame
-    success, img = cap.read()
-    img = cv2.flip(img, 1)  # Mirror the frame
-
-    # Detect hands
-    imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    results = hands.process(imgRGB)
-
-    totalFingers = 0  # Count of fingers raised across both hands
-
-    if results.multi_hand_landmarks:
-        for handLms in results.multi_hand_landmarks:
-            lmList = []
-            for id, lm in enumerate(handLms.landmark):
-                h, w, c = img.shape
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                lmList.append((cx, cy))
-
-            if lmList:
-                x1, y1 = lmList[8]  # Tip of the index finger
-                x2, y2 = lmList[12]  # Tip of the middle finger
-
-                # Determine which fingers are up
-                fingers = []
-                for i in [8, 12, 16, 20]:  # Index, middle, ring, pinky
-                    fingers.append(lmList[i][1] < lmList[i - 2][1])  # Finger is up if above the knuckle
-                thumbUp = lmList[4][0] > lmList[3][0]  # Thumb is up if x-coordinate is greater (for left hand)
-                fingers.append(thumbUp)
-                totalFingers += sum(fingers)
-
-                # Check for selection mode: Two fingers up
-                if fingers[0] and fingers[1]:  # Selection mode
-                    xp, yp = 0, 0
-                    if y1 < 100:  # Tool selection bar
-                        if 50 < x1 < 150:
-                            drawColor = (255, 0, 139)  # Blue
-                            currentTool = "Free Draw"
-                        elif 200 < x1 < 300:
-                            drawColor = (0, 255, 0)  # Green
-                            currentTool = "Free Draw"
-                        elif 350 < x1 < 450:
-                            drawColor = (0, 0, 255)  # Red
-                            currentTool = "Free Draw"
-                        elif 500 < x1 < 600:
-                            drawColor = (0, 0, 0)  # Eraser
-                            currentTool = "Free Draw"
-                        elif 650 < x1 < 750:
-                            currentTool = "Line"
-                        elif 800 < x1 < 900:
-                            currentTool = "Rectangle"
-                        elif 950 < x1 < 1050:
-                            currentTool = "Circle"
-                        elif 1100 < x1 < 1200:  # Undo button
-                            if undoStack:
-                                imgCanvas = undoStack.pop()
-                        cv2.rectangle(img, (x1 - 25, y1 - 25), (x1 + 25, y1 + 25), drawColor, cv2.FILLED)
-
-                # Check for drawing mode: Index finger up, middle finger down
-                elif fingers[0] and not fingers[1]:
-                    cv2.circle(img, (x1, y1), 15, drawColor, cv2.FILLED)
-
-                    if currentTool == "Free Draw":
-                        if xp == 0 and yp == 0:  # Starting point
-                            xp, yp = x1, y1
-                        # Draw lines
-                        if drawColor == (0, 0, 0):
-                            cv2.line(img, (xp, yp), (x1, y1), drawColor, eraserThickness)
-                            cv2.line(imgCanvas, (xp, yp), (x1, y1), drawColor, eraserThickness)
-                        else:
-                            cv2.line(img, (xp, yp), (x1, y1), drawColor, brushThickness)
-                            cv2.line(imgCanvas, (xp, yp), (x1, y1), drawColor, brushThickness)
-                        xp, yp = x1, y1
-
-                    elif currentTool in ["Line", "Rectangle", "Circle"]:
-                        if startPoint is None:
-                            startPoint = (x1, y1)
-                        else:
-                            imgCopy = imgCanvas.copy()
-                            if currentTool == "Line":
-                                cv2.line(imgCopy, startPoint, (x1, y1), drawColor, brushThickness)
-                            elif currentTool == "Rectangle":
-                                cv2.rectangle(imgCopy, startPoint, (x1, y1), drawColor, brushThickness)
-                            elif currentTool == "Circle":
-                                radius = int(((startPoint[0] - x1) * 2 + (startPoint[1] - y1) * 2) ** 0.5)
-                                cv2.circle(imgCopy, startPoint, radius, drawColor, brushThickness)
-                            cv2.imshow("Air Canvas", imgCopy)
-
-                elif not fingers[0]:  # Finalize shapes
-                    if currentTool in ["Line", "Rectangle", "Circle"] and startPoint is not None:
-                        undoStack.append(imgCanvas.copy())  # Store current canvas state in undoStack
-                        if currentTool == "Line":
-                            cv2.line(imgCanvas, startPoint, (x1, y1), drawColor, brushThickness)
-                        elif currentTool == "Rectangle":
-                            cv2.rectangle(imgCanvas, startPoint, (x1, y1), drawColor, brushThickness)
-                        elif currentTool == "Circle":
-                            radius = int(((startPoint[0] - x1) * 2 + (startPoint[1] - y1) * 2) ** 0.5)
-                            cv2.circle(imgCanvas, startPoint, radius, drawColor, brushThickness)
-                        startPoint = None
-                        # Save the canvas state before drawing the shape
-                        undoStack.append(imgCanvas.copy())
-
-    # If all ten fingers are raised, exit the program
-    if totalFingers == 10:
-        print("Ten-finger gesture detected. Terminating program.")
-        break
-
-    # Combine the original frame and the canvas
-    imgGray = cv2.cvtColor(imgCanvas, cv2.COLOR_BGR2GRAY)
-    _, imgInv = cv2.threshold(imgGray, 50, 255, cv2.THRESH_BINARY_INV)
-    imgInv = cv2.cvtColor(imgInv, cv2.COLOR_GRAY2BGR)
-    img = cv2.bitwise_and(img, imgInv)
-    img = cv2.bitwise_or(img, imgCanvas)
-
-    # Create toolbar
-    cv2.rectangle(img, (50, 1), (150, 100), (255, 0, 0), cv2.FILLED)
-    cv2.putText(img, "Blue", (60, 70), cv2.FONT_HERSHEY_PLAIN, 2, (255, 255, 255), 2)
-
-    cv2.rectangle(img, (200, 1), (300, 100), (0, 255, 0), cv2.FILLED)
-    cv2.putText(img, "Green", (210, 70), cv2.FONT_HERSHEY_PLAIN, 2, (255, 255, 255), 2)
-
-    cv2.rectangle(img, (350, 1), (450, 100), (0, 0, 255), cv2.FILLED)
-    cv2.putText(img, "Red", (360, 70), cv2.FONT_HERSHEY_PLAIN, 2, (255, 255, 255), 2)
-
-    cv2.rectangle(img, (500, 1), (600, 100), (0, 0, 0), cv2.FILLED)
-    cv2.putText(img, "Eraser", (510, 70), cv2.FONT_HERSHEY_PLAIN, 2, (255, 255, 255), 2)
-
-    cv2.rectangle(img, (650, 1), (750, 100), (200, 200, 200), cv2.FILLED)
-    cv2.putText(img, "Line", (670, 70), cv2.FONT_HERSHEY_PLAIN, 2, (0, 0, 0), 2)
-
-    cv2.rectangle(img, (800, 1), (900, 100), (200, 200, 200), cv2.FILLED)
-    cv2.putText(img, "Rect", (820, 70), cv2.FONT_HERSHEY_PLAIN, 2, (0, 0, 0), 2)
-
-    cv2.rectangle(img, (950, 1), (1050, 100), (200, 200, 200), cv2.FILLED)
-    cv2.putText(img, "Circle", (960, 70), cv2.FONT_HERSHEY_PLAIN, 2, (0, 0, 0), 2)
-
-    cv2.rectangle(img, (1100, 1), (1200, 100), (100, 100, 255), cv2.FILLED)
-    cv2.putText(img, "Undo", (1110, 70), cv2.FONT_HERSHEY_PLAIN, 2, (255, 255, 255), 2)
-
-    cv2.imshow("Air Canvas", img)
-    cv2.imshow("Canvas", imgCanvas)
-
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Release resources
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+import landmarks
+from detector import HandTracker
+from smoothing import DecimatedTracker
+from pipeline import Pipeline, open_source, run
+from recorder import VideoRecorder
+from governor import QualityGovernor
+from compositor import Compositor
+from strokes import Stroke, StrokeCanvas, draw_strokes, rdp, stroke_log
+from autosave import AutoSaver
+from overlay import Overlay, Button
+from metrics import metrics
+
+width, height = 1280, 720
+maxHands = 4  # Every hand draws with its own tool and color
+sessionPath = "canvas_session"  # Where the drawing is autosaved and restored from
+
+
+def create_tracker():
+    # Initialize Mediapipe Hands module
+    import mediapipe as mp
+    hands = dict(max_num_hands=maxHands, min_detection_confidence=0.8, min_tracking_confidence=0.8)
+    # Detection runs at half resolution and on a crop around the hand once it is found
+    tracker = HandTracker(mp.solutions.hands.Hands, hands, scale=0.5, roi=True)
+    # Skip detection on some frames when it can't keep up with 30 fps; skipped frames get predicted
+    # landmarks, and all landmarks are smoothed so brush strokes don't jitter
+    return DecimatedTracker(tracker, adaptive=True, target_fps=30)
+
+
+class Hand:
+    # Drawing state of one tracked hand, so several people can draw at once
+    def __init__(self):
+        self.currentTool = "Free Draw"  # Default tool
+        self.drawColor = (255, 0, 139)  # Default drawing color
+        self.button = "Blue"  # Toolbar button of the tool and color, highlighted while the hand is tracked
+        self.xp, self.yp = 0, 0  # Previous points
+        self.startPoint = None  # Starting point for shapes (rectangle, circle, line)
+        self.strokePoints = []  # World points of the free-draw stroke in progress
+        self.panStart = None  # Hand position when the pan gesture started
+        self.undoPressed = False  # Undo fires once per visit of the button, not on every frame
+
+
+class AirCanvas:
+    # Free drawing, shapes and undo on a canvas laid over the camera image
+    name = "canvas"
+    size = (width, height)
+
+    def __init__(self, session_path=sessionPath):
+        # Drawing variables
+        self.brushThickness = 15
+        self.eraserThickness = 50
+        # Per-hand state (tool, color, stroke in progress), keyed by ids that follow each hand
+        self.hands = {}
+        self.handIds = landmarks.HandIds()
+        # The drawing itself is a list of vector strokes on an unbounded canvas; the compositor
+        # holds the current view of it (plus its ink mask) and is re-rendered on pan, zoom and undo
+        self.strokes = StrokeCanvas()
+        self.compositor = Compositor(width, height)
+        self.imgCanvas = self.compositor.canvas
+
+        # Changes are written to session_path in the background; the last session is reopened
+        self.session = stroke_log(session_path) if session_path else None
+        self.saver = AutoSaver() if session_path else None
+        if self.session is not None and self.session.exists():
+            self.strokes.restore(self.session)
+            self._render_view()
+        self.savedVersion = self.strokes.version
+        self.done = False
+
+        # Toolbar layout: it is rendered once into a cached sprite and hit-tested through a lookup table
+        self.toolbar = Overlay([
+            Button("Blue", (50, 1, 150, 100), (255, 0, 0), tool="Free Draw", color=(255, 0, 139)),
+            Button("Green", (200, 1, 300, 100), (0, 255, 0), tool="Free Draw", color=(0, 255, 0)),
+            Button("Red", (350, 1, 450, 100), (0, 0, 255), tool="Free Draw", color=(0, 0, 255)),
+            Button("Eraser", (500, 1, 600, 100), (0, 0, 0), tool="Free Draw", color=(0, 0, 0)),
+            Button("Line", (650, 1, 750, 100), (200, 200, 200), text_color=(0, 0, 0), text_offset=(20, 69),
+                   tool="Line"),
+            Button("Rectangle", (800, 1, 900, 100), (200, 200, 200), label="Rect", text_color=(0, 0, 0),
+                   text_offset=(20, 69), tool="Rectangle"),
+            Button("Circle", (950, 1, 1050, 100), (200, 200, 200), text_color=(0, 0, 0), tool="Circle"),
+            Button("Undo", (1100, 1, 1200, 100), (100, 100, 255), action="undo"),
+        ], (width, height))
+        self.toolbar.set_active("Blue")
+
+    def step(self, img, detection, t):
+        # One frame: gesture handling on the landmarks, then compositing. Returns the windows to show.
+        with metrics.stage("gesture"):
+            self._gesture(img, detection)
+        self._autosave()
+
+        # Combine the original frame and the canvas (only inked tiles are touched)
+        with metrics.stage("composite"):
+            self.compositor.compose(img)
+
+            # Draw the cached toolbar sprite
+            self.toolbar.blit(img)
+
+        return {"Air Canvas": img, "Canvas": self.imgCanvas}
+
+    def _gesture(self, img, detection):
+        h, w, c = img.shape
+        lmPixels = landmarks.to_pixels(detection.points, w, h)
+        fingersUp = landmarks.fingers_up(detection.points)  # Thumb, index, middle, ring, pinky
+        ids = self.handIds(landmarks.centers(lmPixels)).tolist()
+        tips = lmPixels[:, landmarks.INDEX_TIP].tolist()  # Tip of the index finger of every hand
+
+        # Gesture of every hand at once
+        index, middle, ring, pinky = fingersUp[:, 1], fingersUp[:, 2], fingersUp[:, 3], fingersUp[:, 4]
+        panning = index & middle & ring & ~pinky  # Index, middle and ring finger up
+        selecting = index & middle & ~panning  # Two fingers up
+        drawing = index & ~middle  # Index finger up, middle finger down
+
+        for i, handId in enumerate(ids):
+            hand = self.hands.get(handId)
+            if hand is None:
+                hand = self.hands[handId] = Hand()
+            x1, y1 = tips[i]
+            onUndo = False
+
+            # Check for pan mode: the view follows the hand
+            if panning[i]:
+                hand.xp, hand.yp = 0, 0
+                if self._drawing(hand):
+                    hand.panStart = None  # The view holds still while another hand draws through it
+                else:
+                    if hand.panStart is not None:
+                        self.strokes.pan(x1 - hand.panStart[0], y1 - hand.panStart[1])
+                        self._render_view()
+                    hand.panStart = (x1, y1)
+
+            # Check for selection mode
+            elif selecting[i]:
+                hand.xp, hand.yp = 0, 0
+                button = self.toolbar.hit(x1, y1)  # Tool selection bar
+                if button is not None:
+                    if button.data.get("action") == "undo":
+                        onUndo = True
+                        if not hand.undoPressed and not self._drawing(hand):  # Nor while another hand draws
+                            self._end_stroke(hand)
+                            if self.strokes.undo():
+                                self._render_view()
+                    else:
+                        hand.currentTool = button.data["tool"]
+                        hand.drawColor = button.data.get("color", hand.drawColor)
+                        hand.button = button.name
+                if y1 < 100:
+                    cv2.rectangle(img, (x1 - 25, y1 - 25), (x1 + 25, y1 + 25), hand.drawColor, cv2.FILLED)
+
+            # Check for drawing mode
+            elif drawing[i]:
+                cv2.circle(img, (x1, y1), 15, hand.drawColor, cv2.FILLED)
+
+                if hand.currentTool == "Free Draw":
+                    if hand.xp == 0 and hand.yp == 0:  # Starting point
+                        hand.xp, hand.yp = x1, y1
+                    hand.strokePoints.append(self.strokes.to_world(x1, y1))
+                    # Draw lines (only the segment's bounding box of the ink mask is updated)
+                    thickness = self.eraserThickness if hand.drawColor == (0, 0, 0) else self.brushThickness
+                    self.compositor.line((hand.xp, hand.yp), (x1, y1), hand.drawColor, thickness)
+                    hand.xp, hand.yp = x1, y1
+
+                elif hand.currentTool in ["Line", "Rectangle", "Circle"]:
+                    if hand.startPoint is None:
+                        hand.startPoint = (x1, y1)
+                    else:
+                        # Preview is drawn as an overlay on the output frame, the canvas is untouched
+                        self.compositor.preview(hand.currentTool, hand.startPoint, (x1, y1), hand.drawColor,
+                                                self.brushThickness)
+
+            elif not index[i]:  # Finalize shapes
+                if hand.currentTool in ["Line", "Rectangle", "Circle"] and hand.startPoint is not None:
+                    self.compositor.shape(hand.currentTool, hand.startPoint, (x1, y1), hand.drawColor,
+                                          self.brushThickness)
+                    # Each finalized shape is one stroke, and so one undo step
+                    points = [self.strokes.to_world(*hand.startPoint), self.strokes.to_world(x1, y1)]
+                    self.strokes.add(Stroke(hand.currentTool, hand.drawColor, self.brushThickness / self.strokes.zoom,
+                                            np.float32(points)))
+                    hand.startPoint = None
+
+            # A stroke (or eraser pass) ends as soon as the hand leaves drawing mode
+            if not (drawing[i] and hand.currentTool == "Free Draw"):
+                self._release(hand)
+            if not panning[i]:
+                hand.panStart = None
+            hand.undoPressed = onUndo
+
+        # Hands out of view end what they were doing; their state goes once their id expires
+        for handId in set(self.hands) - set(ids):
+            self._release(self.hands[handId])
+            self.hands[handId].panStart = None
+        for handId in set(self.hands) - set(self.handIds.ids.tolist()):
+            del self.hands[handId]
+        if self.hands:
+            self.toolbar.set_active(*(hand.button for hand in self.hands.values()))
+
+        # If both hands of a two-hand session show all five fingers, exit the program
+        if detection.count == 2 and fingersUp.all():
+            print("Ten-finger gesture detected. Terminating program.")
+            self.done = True
+
+    def _drawing(self, hand):
+        # Whether a hand other than this one has a stroke or shape in progress
+        return any(other.strokePoints or other.startPoint is not None
+                   for other in self.hands.values() if other is not hand)
+
+    def _release(self, hand):
+        self._end_stroke(hand)
+        hand.xp, hand.yp = 0, 0
+
+    def _end_stroke(self, hand):
+        # Store the hand's free-draw stroke in progress, simplified to the points that matter
+        if not hand.strokePoints:
+            return
+        thickness = self.eraserThickness if hand.drawColor == (0, 0, 0) else self.brushThickness
+        stroke = Stroke("Free Draw", hand.drawColor, thickness / self.strokes.zoom,
+                        rdp(hand.strokePoints, 1.0 / self.strokes.zoom))
+        self.strokes.add(stroke)
+        hand.strokePoints = []
+        # Draw the stored stroke over its live ink, so the view shows what was kept
+        view = self.strokes
+        draw_strokes(self.imgCanvas, [stroke], view.x, view.y, view.zoom)
+        x0, y0, x1, y1 = view.bounds[-1]
+        self.compositor.refresh((x0 - view.x) * view.zoom, (y0 - view.y) * view.zoom,
+                                (x1 - view.x) * view.zoom, (y1 - view.y) * view.zoom)
+
+    def _autosave(self):
+        # Only hands a snapshot to the saver thread, the writing happens there
+        if self.saver is not None and self.strokes.version != self.savedVersion:
+            self.savedVersion = self.strokes.version
+            self.saver.submit(self.session, self.session.write, *self.strokes.snapshot())
+
+    def _render_view(self):
+        # Strokes in progress are stored first: the re-render clears their live ink, and their
+        # next points would be taken through the moved view. Drawing hands carry on with a new stroke.
+        for hand in self.hands.values():
+            self._release(hand)
+        self.strokes.render_view(self.imgCanvas)
+        self.compositor.refresh(0, 0, width, height)
+
+    def handle_key(self, key):
+        if key == ord('q'):
+            self.done = True
+        elif key in (ord('z'), ord('y')):  # Keyboard undo / redo
+            for hand in self.hands.values():
+                self._release(hand)
+            changed = self.strokes.undo() if key == ord('z') else self.strokes.redo()
+            if changed:
+                self._render_view()
+        elif key in (ord('+'), ord('=')):  # Zoom around the middle of the view
+            self.strokes.zoom_at(1.25, width / 2, height / 2)
+            self._render_view()
+        elif key == ord('-'):
+            self.strokes.zoom_at(0.8, width / 2, height / 2)
+            self._render_view()
+        elif key == ord('0'):
+            self.strokes.reset_view()
+            self._render_view()
+
+    def close(self):
+        for hand in self.hands.values():
+            self._end_stroke(hand)
+        self._autosave()
+        if self.saver is not None:
+            self.saver.close()  # Waits for the last write
+
+
+if __name__ == "__main__":
+    # Frame source setup (webcam index, video file, image folder or "synthetic")
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0, width, height)
+    # Capture and hand detection run on their own threads, the canvas is updated on this one
+    # Set AIR_CANVAS_METRICS to a file name to get a JSON dump of the stage timings on exit
+    # and AIR_CANVAS_RECORD to a video file name to record the session. Detection quality is
+    # lowered when the frame rate can't keep up with AIR_CANVAS_TARGET_FPS (30, 0 turns that off)
+    pipeline = Pipeline(source, create_tracker())
+    run(AirCanvas(), pipeline, metrics_path=os.environ.get("AIR_CANVAS_METRICS"), recorder=VideoRecorder.from_env(),
+        governor=QualityGovernor.from_env(pipeline))
@@ -1,88 +1,59 @@
-import cv2 
-import mediapipe as mp
-import pyautogui
-import time
+import os
+import sys
+import landmarks
+from detector import HandTracker
+from pipeline import Pipeline, open_source, run
+from recorder import VideoRecorder
+from governor import QualityGovernor
+from input_dispatch import InputDispatcher
+from gestures import GestureEngine, Pose
 
-def count_fingers(lst):
-    cnt = 0
+# Finger count (tip above knuckle by half the palm size) -> key, pressed once the count has
+# held for settleTime seconds; holding it doesn't repeat the key
+KEYS = {1: "right", 2: "left", 3: "up", 4: "down", 5: "space"}
+settleTime = 0.2
 
-    thresh = (lst.landmark[0].y*100 - lst.landmark[9].y*100)/2
 
-    if (lst.landmark[5].y*100 - lst.landmark[8].y*100) > thresh:
-        cnt += 1
+def create_tracker():
+    import mediapipe as mp
+    return HandTracker(mp.solutions.hands.Hands, dict(max_num_hands=1), roi=True)
 
-    if (lst.landmark[9].y*100 - lst.landmark[12].y*100) > thresh:
-        cnt += 1
 
-    if (lst.landmark[13].y*100 - lst.landmark[16].y*100) > thresh:
-        cnt += 1
+class GestureKeys:
+    # Finger count of one hand pressed as arrow keys / space once the count has settled
+    name = "gestures"
+    size = None
 
-    if (lst.landmark[17].y*100 - lst.landmark[20].y*100) > thresh:
-        cnt += 1
+    def __init__(self, dispatcher=None):
+        # Key presses are sent from a worker thread, gesture timing below already spaces them out
+        self.dispatcher = dispatcher or InputDispatcher(key_interval=0)
+        self.gestures = GestureEngine([Pose(key, count=count, rule="extended", hold=settleTime)
+                                       for count, key in KEYS.items()])
+        self.done = False
 
-    if (lst.landmark[5].x*100 - lst.landmark[4].x*100) > 6:
-        cnt += 1
+    def step(self, frm, res, t):
+        h, w = frm.shape[:2]
 
+        # Keys of the first hand's finger count
+        hand = landmarks.Detection(res.points[:1], res.right[:1])
+        for event in self.gestures.update(hand, t, (w, h)):
+            self.dispatcher.press(event.name, now=t)
 
-    return cnt 
+        if res.count:
+            landmarks.draw(frm, landmarks.to_pixels(res.points[:1], w, h))
 
-cap = cv2.VideoCapture(0)
+        return {"window": frm}
 
-drawing = mp.solutions.drawing_utils
-hands = mp.solutions.hands
-hand_obj = hands.Hands(max_num_hands=1)
+    def handle_key(self, key):
+        if key == 27:
+            self.done = True
 
+    def close(self):
+        self.dispatcher.close()
 
-start_init = False 
 
-prev = -1
-
-while True:
-    end_time = time.time()
-    _, frm = cap.read()
-    frm = cv2.flip(frm, 1)
-
-    res = hand_obj.process(cv2.cvtColor(frm, cv2.COLOR_BGR2RGB))
-
-    if res.multi_hand_landmarks:
-
-        hand_keyPoints = res.multi_hand_landmarks[0]
-
-        cnt = count_fingers(hand_keyPoints)
-
-        if not(prev==cnt):
-            if not(start_init):
-                start_time = time.time()
-                start_init = True
-
-            elif (end_time-start_time) > 0.2:
-                if (cnt == 1):
-                    pyautogui.press("right")
-                
-                elif (cnt == 2):
-                    pyautogui.press("left")
-
-                elif (cnt == 3):
-                    pyautogui.press("up")
-
-                elif (cnt == 4):
-                    pyautogui.press("down")
-
-                elif (cnt == 5):
-                    pyautogui.press("space")
-
-                prev = cnt
-                start_init = False
-
-
-        
-
-
-        drawing.draw_landmarks(frm, hand_keyPoints, hands.HAND_CONNECTIONS)
-
-    cv2.imshow("window", frm)
-
-    if cv2.waitKey(1) == 27:
-        cv2.destroyAllWindows()
-        cap.release()
-        break
\ No newline at end of file
+if __name__ == "__main__":
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0)
+    pipeline = Pipeline(source, create_tracker())
+    run(GestureKeys(), pipeline, metrics_path=os.environ.get("AIR_CANVAS_METRICS"), recorder=VideoRecorder.from_env(),
+        governor=QualityGovernor.from_env(pipeline))
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+from autosave import StrokeLog
+
+
+class SlideAnnotations:
+    # Strokes of one slide as int16 point arrays plus a cached raster layer. New points are
+    # drawn into the layer as they arrive, so showing the annotations is one masked copy
+    # (limited to the inked bounding box) however many strokes there are.
+    def __init__(self, size, color=(0, 0, 200), thickness=12, strokes=None):
+        self.size = size
+        self.color = color
+        self.thickness = thickness
+        self.strokes = list(strokes) if strokes else []  # Finished strokes, each an (n, 2) int16 array
+        self.current = None  # Points of the stroke being drawn
+        self.layer = None  # Raster layer, built on first use
+        self.mask = None
+        self.box = None  # (x0, y0, x1, y1) of all ink in the layer
+        self.version = 0  # Bumped whenever the finished strokes change
+
+    def _rasterize(self):
+        width, height = self.size
+        self.layer = np.zeros((height, width, 3), np.uint8)
+        self.mask = np.zeros((height, width), np.uint8)
+        self.box = None
+        strokes = [s for s in self.strokes + ([np.array(self.current, np.int16)] if self.current else []) if len(s)]
+        for target, color in ((self.layer, self.color), (self.mask, 255)):
+            cv2.polylines(target, [s.astype(np.int32).reshape(-1, 1, 2) for s in strokes if len(s) > 1],
+                          False, color, self.thickness)
+        for stroke in strokes:
+            self._grow(stroke.min(axis=0), stroke.max(axis=0))
+
+    def _grow(self, lo, hi):
+        pad = self.thickness // 2 + 1
+        x0, y0, x1, y1 = int(lo[0]) - pad, int(lo[1]) - pad, int(hi[0]) + pad + 1, int(hi[1]) + pad + 1
+        if self.box is not None:
+            x0, y0 = min(x0, self.box[0]), min(y0, self.box[1])
+            x1, y1 = max(x1, self.box[2]), max(y1, self.box[3])
+        width, height = self.size
+        self.box = (max(0, x0), max(0, y0), min(width, x1), min(height, y1))
+
+    def add_point(self, point):
+        # Continue the current stroke (starting one if needed) and rasterize only the new segment
+        if self.layer is None:
+            self._rasterize()
+        point = (int(point[0]), int(point[1]))
+        if self.current is None:
+            self.current = []
+        if self.current:
+            previous = self.current[-1]
+            cv2.line(self.layer, previous, point, self.color, self.thickness)
+            cv2.line(self.mask, previous, point, 255, self.thickness)
+            self._grow(np.minimum(previous, point), np.maximum(previous, point))
+        self.current.append(point)
+
+    def end_stroke(self):
+        if self.current:
+            self.strokes.append(np.array(self.current, np.int16))
+            self.version += 1
+        self.current = None
+
+    def undo(self):
+        # Remove the last stroke; the layer is rebuilt from the remaining point arrays
+        self.end_stroke()
+        if not self.strokes:
+            return False
+        self.strokes.pop()
+        self.version += 1
+        self._rasterize()
+        return True
+
+    def draw(self, img):
+        if self.layer is None:
+            self._rasterize()
+        if self.box is None:
+            return img
+        x0, y0, x1, y1 = self.box
+        np.copyto(img[y0:y1, x0:x1], self.layer[y0:y1, x0:x1], where=self.mask[y0:y1, x0:x1, None].astype(bool))
+        return img
+
+
+class AnnotationStore:
+    # Annotations for every slide of a deck, kept while navigating between slides
+    def __init__(self, size, color=(0, 0, 200), thickness=12):
+        self.size = size
+        self.color = color
+        self.thickness = thickness
+        self.slides = {}
+        self.log = None  # StrokeLog of the last save or load path
+
+    def __getitem__(self, i):
+        if i not in self.slides:
+            self.slides[i] = SlideAnnotations(self.size, self.color, self.thickness)
+        return self.slides[i]
+
+    @property
+    def version(self):
+        return sum(slide.version for slide in self.slides.values())
+
+    def _log(self, path):
+        if self.log is None or self.log.path != path:
+            self.log = StrokeLog(path, [("slide", "<i4")], np.int16)
+        return self.log
+
+    def snapshot(self):
+        # Finished strokes of all slides as StrokeLog items; cheap, strokes are never modified
+        return [((i,), stroke) for i, slide in sorted(self.slides.items()) for stroke in slide.strokes]
+
+    def save(self, path, items=None):
+        # Writes the strokes that changed since the last save to the log directory at path.
+        # With items (a snapshot()) nothing here is touched, so it can run on another thread.
+        if items is None:
+            for slide in self.slides.values():
+                slide.end_stroke()
+            items = self.snapshot()
+        self._log(path).write(items, {"size": list(self.size)})
+
+    def load(self, path):
+        # Only the index is read; stroke points are memory-mapped and each slide builds its
+        # layer the first time it is shown
+        log = self._log(path)
+        meta, records, points = log.read()
+        self.slides = {}
+        for record in records:
+            offset, count = int(record["offset"]), int(record["count"])
+            self[int(record["slide"])].strokes.append(points[offset:offset + count])
+        # Records are in snapshot() order, which is how save() wrote them
+        log.prime([stroke for _, stroke in self.snapshot()], records["offset"])
+        return self
@@ -1,36 +1,71 @@
-from flask import Flask, render_template
-import subprocess
-import sys
+from flask import Flask, Response, jsonify, render_template
+import os
+import threading
+
+from streaming import BOUNDARY, PRIMARY, StreamHub
+from worker import Worker
 
 app = Flask(__name__)
 
+# One resident worker runs every mode in this process: the camera and hand models are loaded
+# once, and the routes below only switch modes (AIR_CANVAS_SOURCE picks another frame source)
+hub = StreamHub()  # The worker's windows, streamed to the browser
+worker = Worker(os.environ.get("AIR_CANVAS_SOURCE", 0), hub=hub)
+
 @app.route("/")
 def home():
     return render_template("index.html")  # Your HTML file
 
+@app.route("/start/<mode>", methods=["GET", "POST"])
+def start(mode):
+    try:
+        worker.start(mode)
+    except KeyError:
+        return jsonify(error=f"Unknown mode: {mode}"), 404
+    return jsonify(worker.status())
+
+@app.route("/stop", methods=["GET", "POST"])
+def stop():
+    worker.stop()
+    return jsonify(worker.status())
+
+@app.route("/status")
+def status():
+    return jsonify(worker.status())
+
+@app.route("/stream")
+@app.route("/stream/<view>")
+def stream(view=PRIMARY):
+    # MJPEG stream of one window ("Air Canvas", "Canvas", "Slides", ...), by default the main one
+    return Response(hub.mjpeg(view), mimetype="multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+
+@app.route("/streams")
+def streams():
+    return jsonify(views=hub.views, streams=hub.status())
+
 @app.route("/launch_canvas")
 def launch_canvas():
-    try:
-        subprocess.Popen([sys.executable, "air_canvas.py"])  # Launch the Air Canvas script
-        return "Air Canvas launched successfully!"
-    except Exception as e:
-        return f"Error launching Air Canvas: {e}"
+    worker.start("canvas")  # Switch the worker to Air Canvas
+    return "Air Canvas launched successfully!"
 
 @app.route("/launch_ppt")
 def launch_ppt():
-    try:
-        subprocess.Popen([sys.executable, "pmp.py"])  # Launch the PPT Viewer script
-        return "PPT Viewer launched successfully!"
-    except Exception as e:
-        return f"Error launching PPT Viewer: {e}"
-    
+    worker.start("slides")  # Switch the worker to the PPT Viewer
+    return "PPT Viewer launched successfully!"
+
 @app.route("/launch_system")
 def launch_system():
-    try:
-        subprocess.Popen([sys.executable, "proj3a.py"])  # Launch the PPT Viewer script
-        return "PPT Viewer launched successfully!"
-    except Exception as e:
-        return f"Error launching PPT Viewer: {e}"
+    worker.start("system")  # Switch the worker to the System Controller
+    return "System Controller launched successfully!"
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    worker.warm_up()
+    # The worker's render loop owns the main thread (OpenCV windows), Flask serves from another
+    threading.Thread(target=app.run, kwargs={"debug": True, "use_reloader": False}, daemon=True).start()
+    try:
+        worker.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+        hub.close()
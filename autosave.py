@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 2  # 2: points file named in meta.json, offsets need not be contiguous
+
+
+class StrokeLog:
+    # Stroke list on disk as two flat files plus metadata:
+    #   index.bin     one fixed-size record per stroke (offset and length into the points file
+    #                 plus the caller's fields), so the whole index is read with a single fromfile
+    #   points.N.bin  stroke points, memory-mapped on load so a stroke is only read from disk
+    #                 when it is drawn
+    #   meta.json     stroke count, points file and caller metadata, replaced atomically after
+    #                 each write
+    # Restored strokes are views into the points file, so it is only ever appended to, never
+    # truncated or rewritten. write() rewrites the index records after the first stroke that
+    # differs from what is on disk (by identity; strokes are never modified after they are
+    # finished) and appends the points of the strokes from there on, so appending a stroke or
+    # undoing one costs one record and its points, not the whole drawing. Points of undone
+    # strokes stay behind; once they outweigh the live points (and compact_min), the live
+    # points are copied into the next points.N.bin and the old file is unlinked, which leaves
+    # existing mappings of it intact.
+    def __init__(self, path, fields, point_dtype, compact_min=1 << 16):
+        self.path = path
+        self.dtype = np.dtype([("offset", "<i8"), ("count", "<i4")] + list(fields))
+        self.point_dtype = np.dtype(point_dtype)
+        self.row = 2 * self.point_dtype.itemsize
+        self.compact_min = compact_min
+        self.written = []  # Point arrays of the strokes on disk, in order
+        self.offsets = []  # Point offset of each of them in the points file
+        self.points_name = None  # Current points file, None until read or first written
+        self.generation = -1
+        self.end = 0  # Points in the points file, live or not
+        self.meta = None  # Caller metadata last written
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def read(self):
+        # (meta, records, points); points is a memmap (or empty). Readers should call
+        # prime() with the strokes they build so the next write() continues from there.
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        records = np.fromfile(self._file("index.bin"), self.dtype)[:meta["count"]]
+        self.points_name = meta.get("points", "points.bin")  # Version 1 had a single points.bin
+        self.generation = meta.get("generation", 0)
+        points_path = self._file(self.points_name)
+        self.end = os.path.getsize(points_path) // self.row if os.path.exists(points_path) else 0
+        if self.end:
+            points = np.memmap(points_path, self.point_dtype, mode="r", shape=(self.end, 2))
+        else:
+            points = np.zeros((0, 2), self.point_dtype)
+        self.meta = {k: v for k, v in meta.items() if k not in ("version", "count", "points", "generation")}
+        self._remove_stale()
+        return meta, records, points
+
+    def exists(self):
+        return os.path.exists(self._file("meta.json"))
+
+    def prime(self, strokes, offsets):
+        # strokes: point arrays built from read()'s records, offsets: their records["offset"]
+        self.written = list(strokes)
+        self.offsets = [int(offset) for offset in offsets]
+
+    def _new_points_file(self):
+        # Next generation, past any points file already in the directory
+        generations = [self.generation]
+        for name in os.listdir(self.path):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "points" and parts[1].isdigit() and parts[2] == "bin":
+                generations.append(int(parts[1]))
+        self.generation = max(generations) + 1
+        self.points_name = "points.%d.bin" % self.generation
+        open(self._file(self.points_name), "xb").close()
+        self.end = 0
+
+    def _remove_stale(self):
+        # Points files of earlier generations. Unlinking a mapped file is fine on POSIX; where
+        # it isn't (Windows) the file stays until a later call finds it unmapped.
+        for name in os.listdir(self.path):
+            if name.startswith("points.") and name.endswith(".bin") and name != self.points_name:
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+
+    def write(self, items, meta=None):
+        # items: [(fields tuple, points array)] for every stroke, in order
+        first = 0
+        limit = min(len(items), len(self.written))
+        while first < limit and items[first][1] is self.written[first]:
+            first += 1
+        meta = meta or {}
+        if first == len(items) == len(self.written):
+            if meta == self.meta:
+                return False
+            self._write_meta(meta, len(items))  # Only the metadata changed (e.g. the view)
+            return True
+        os.makedirs(self.path, exist_ok=True)
+        del self.written[first:], self.offsets[first:]
+        live = sum(len(points) for _, points in items)
+        compact = (self.points_name is None or not os.path.exists(self._file(self.points_name))
+                   or self.end - live > max(live, self.compact_min))
+        if compact:
+            self._new_points_file()
+            first = 0
+            self.written, self.offsets = [], []
+        records = np.zeros(len(items) - first, self.dtype)
+        with open(self._file(self.points_name), "r+b") as f:
+            f.seek(self.end * self.row)  # Anything past the end is left over from a failed write
+            for i, (fields, points) in enumerate(items[first:]):
+                points = np.ascontiguousarray(points, self.point_dtype)
+                records["offset"][i], records["count"][i] = self.end, len(points)
+                for name, value in zip(self.dtype.names[2:], fields):
+                    records[name][i] = value
+                f.write(points.tobytes())
+                self.offsets.append(self.end)
+                self.end += len(points)
+        with open(self._file("index.bin"), "ab+") as f:
+            f.truncate(first * self.dtype.itemsize)
+            f.write(records.tobytes())
+        self.written += [points for _, points in items[first:]]
+        self._write_meta(meta, len(items))
+        if compact:
+            self._remove_stale()
+        return True
+
+    def _write_meta(self, meta, count):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self._file("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(dict(meta, version=FORMAT_VERSION, count=count, points=self.points_name,
+                           generation=self.generation), f)
+        os.replace(tmp_path, self._file("meta.json"))
+        self.meta = meta
+
+
+class AutoSaver:
+    # Writes snapshots from a background thread so saving never costs frame time. The frame
+    # loop hands over a snapshot whenever something changed; only the latest snapshot per
+    # target is kept, and targets are written at most every `interval` seconds.
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.pending = {}  # target -> (write function, arguments)
+        self.cond = threading.Condition()
+        self.running = True
+        self.error = None
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def submit(self, target, write, *args):
+        # write(*args) runs later on the saver thread, args must not be changed by the caller
+        with self.cond:
+            self.pending[target] = (write, args)
+            self.cond.notify()
+
+    def _flush(self):
+        with self.cond:
+            pending, self.pending = self.pending, {}
+        for write, args in pending.values():
+            try:
+                write(*args)
+            except Exception as e:
+                self.error = e
+                print("Autosave failed:", e)
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    break
+                # Let more changes pile up before writing
+                deadline = time.monotonic() + self.interval
+                while self.running and time.monotonic() < deadline:
+                    self.cond.wait(deadline - time.monotonic())
+            self._flush()
+        self._flush()
+
+    def close(self):
+        # Writes whatever is still pending before returning
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
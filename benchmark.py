@@ -0,0 +1,136 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import landmarks
+import modes
+from metrics import metrics
+from pipeline import Pipeline, SyntheticSource, open_source
+from replay import Recording, ReplayDetector, ReplaySource
+
+# Index finger up, other fingers curled, relative to the hand centre in normalized coordinates
+HAND_POSE = np.float32([
+    (0.0, 0.10, 0),
+    (-0.03, 0.08, 0), (-0.05, 0.05, 0), (-0.06, 0.03, 0), (-0.07, 0.01, 0),
+    (-0.02, 0.0, 0), (-0.02, -0.04, 0), (-0.02, -0.07, 0), (-0.02, -0.10, 0),
+    (0.0, 0.0, 0), (0.0, -0.03, 0), (0.0, -0.01, 0), (0.0, 0.01, 0),
+    (0.02, 0.005, 0), (0.02, -0.025, 0), (0.02, -0.005, 0), (0.02, 0.015, 0),
+    (0.04, 0.01, 0), (0.04, -0.015, 0), (0.04, 0.0, 0), (0.04, 0.02, 0),
+])
+
+
+class SyntheticDetector:
+    # Scripted hand for benchmarking without mediapipe: it circles the frame drawing with the
+    # index finger and every `period` frames raises the middle finger for a few frames
+    def __init__(self, period=90, select_frames=10):
+        self.period = period
+        self.select_frames = select_frames
+        self.index = 0
+
+    def __call__(self, frame, t):
+        i = self.index
+        self.index += 1
+        points = HAND_POSE.copy()
+        if i % self.period < self.select_frames:
+            points[landmarks.MIDDLE_TIP] = (0.0, -0.10, 0)
+        angle = i * 0.03
+        points[:, 0] += 0.5 + 0.25 * np.cos(angle)
+        points[:, 1] += 0.55 + 0.2 * np.sin(angle)
+        return landmarks.Detection(points[None], np.zeros(1, bool))
+
+
+def bench_mode(name, frames=300, recording=None, detector=False, source=None):
+    # Runs one mode headless through the threaded pipeline and returns its metrics.
+    # source (a video file or image folder) replaces the synthetic frames, e.g. to time the
+    # detector on footage that actually shows hands.
+    metrics.reset()
+    mode = modes.create(name, headless=True)
+    size = mode.size or (640, 480)
+    if recording is not None:
+        rec = Recording(recording, size)
+        pipeline = Pipeline(ReplaySource(rec), ReplayDetector(rec), flip=False)
+    else:
+        _, create_tracker = modes.load(name)
+        infer = create_tracker() if detector else SyntheticDetector()
+        frame_source = open_source(source, *size) if source else SyntheticSource(size, frames)
+        pipeline = Pipeline(frame_source, infer)
+    start = time.perf_counter()
+    count = 0
+    try:
+        for packet in pipeline:
+            with metrics.stage("step"):
+                mode.step(packet.frame, packet.result, packet.t)
+            if recording is None:
+                metrics.record("latency", time.monotonic() - packet.t)
+            metrics.tick()
+            count += 1
+            if mode.done or count >= frames:
+                break
+    finally:
+        pipeline.stop()
+        mode.close()
+    elapsed = time.perf_counter() - start
+    result = metrics.snapshot()
+    result["throughput_fps"] = count / elapsed if elapsed else 0.0
+    return result
+
+
+def compare(results, baseline, threshold):
+    # Throughput below, or step p95 above, the baseline by more than threshold is a regression
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["throughput_fps"] < base["throughput_fps"] * (1 - threshold):
+            regressions.append("%s: throughput %.1f fps, baseline %.1f fps"
+                               % (name, result["throughput_fps"], base["throughput_fps"]))
+        step, base_step = result["stages"].get("step", {}), base["stages"].get("step", {})
+        if step.get("count") and base_step.get("count") and step["p95_ms"] > base_step["p95_ms"] * (1 + threshold):
+            regressions.append("%s: step p95 %.2f ms, baseline %.2f ms" % (name, step["p95_ms"], base_step["p95_ms"]))
+    return regressions
+
+
+def report(name, result):
+    print("%s: %.1f fps" % (name, result["throughput_fps"]))
+    print("  %-14s %8s %8s %8s %8s" % ("stage", "p50 ms", "p95 ms", "p99 ms", "count"))
+    for stage, s in sorted(result["stages"].items()):
+        if s["count"]:
+            print("  %-14s %8.2f %8.2f %8.2f %8d" % (stage, s["p50_ms"], s["p95_ms"], s["p99_ms"], s["count"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless throughput and latency benchmark for each mode")
+    parser.add_argument("--modes", nargs="+", default=["canvas", "slides", "system"], choices=sorted(modes.MODES))
+    parser.add_argument("--frames", type=int, default=300, help="synthetic frames per mode")
+    parser.add_argument("--recording", help="replay this recording instead of synthetic input")
+    parser.add_argument("--detector", action="store_true", help="run the real hand detector on the frames")
+    parser.add_argument("--source", help="video file or image folder to use instead of synthetic frames")
+    parser.add_argument("--save", help="write the results as JSON (e.g. to use as a baseline)")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.modes:
+        results[name] = bench_mode(name, args.frames, args.recording, args.detector, args.source)
+        report(name, results[name])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import math
+
+import cv2
+import numpy as np
+
+
+def shape_bounds(tool, start, end, thickness):
+    # Bounding box (x0, y0, x1, y1) of everything a draw call can touch
+    pad = thickness // 2 + 2
+    if tool == "Circle":
+        radius = shape_radius(start, end)
+        return (start[0] - radius - pad, start[1] - radius - pad,
+                start[0] + radius + pad, start[1] + radius + pad)
+    return (min(start[0], end[0]) - pad, min(start[1], end[1]) - pad,
+            max(start[0], end[0]) + pad, max(start[1], end[1]) + pad)
+
+
+def shape_radius(start, end):
+    return int(math.hypot(start[0] - end[0], start[1] - end[1]))
+
+
+def draw_shape(img, tool, start, end, color, thickness):
+    # Free Draw segments and Line are both plain lines
+    if tool == "Rectangle":
+        cv2.rectangle(img, start, end, color, thickness)
+    elif tool == "Circle":
+        cv2.circle(img, start, shape_radius(start, end), color, thickness)
+    else:
+        cv2.line(img, start, end, color, thickness)
+
+
+class Compositor:
+    # Keeps the drawing canvas together with a persistent ink mask. Each draw call only
+    # refreshes the mask inside its own bounding box, and the mask is summarised per tile
+    # so compositing onto the camera frame only touches tiles that actually hold ink.
+    def __init__(self, width=1280, height=720, threshold=50, tile=40):
+        self.width, self.height = width, height
+        self.threshold = threshold  # Canvas pixels brighter than this (in gray) count as ink
+        self.tile = tile
+        self.canvas = np.zeros((height, width, 3), np.uint8)
+        self.mask = np.zeros((height, width), bool)
+        self.ink = np.zeros((math.ceil(height / tile), math.ceil(width / tile)), bool)
+        self.runs = []  # Cached (y0, y1, x0, x1) blocks of inked tiles, rebuilt when ink changes
+        self.overlays = []  # One-shot shape previews drawn on top of the next composed frame
+
+    def line(self, p1, p2, color, thickness):
+        self.shape("Line", p1, p2, color, thickness)
+
+    def shape(self, tool, start, end, color, thickness):
+        bounds = shape_bounds(tool, start, end, thickness)
+        draw_shape(self.canvas, tool, start, end, color, thickness)
+        self.refresh(*bounds)
+
+    def preview(self, tool, start, end, color, thickness):
+        # Shapes in progress are not written to the canvas, they are drawn over the output frame
+        self.overlays.append((tool, start, end, color, thickness))
+
+    def refresh(self, x0, y0, x1, y1):
+        # Snap the box to the tile grid so the tile summary can be rebuilt from it
+        t = self.tile
+        tx0, ty0 = max(0, int(x0) // t), max(0, int(y0) // t)
+        tx1, ty1 = min(self.ink.shape[1], int(x1) // t + 1), min(self.ink.shape[0], int(y1) // t + 1)
+        if tx0 >= tx1 or ty0 >= ty1:
+            return
+        ys, xs = slice(ty0 * t, ty1 * t), slice(tx0 * t, tx1 * t)
+        gray = cv2.cvtColor(self.canvas[ys, xs], cv2.COLOR_BGR2GRAY)
+        mask = gray > self.threshold
+        self.mask[ys, xs] = mask
+        for ty in range(ty1 - ty0):
+            for tx in range(tx1 - tx0):
+                self.ink[ty0 + ty, tx0 + tx] = mask[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t].any()
+        self._build_runs()
+
+    def _build_runs(self):
+        # Merge neighbouring inked tiles on each tile row into one block
+        t = self.tile
+        self.runs = []
+        for ty, row in enumerate(self.ink):
+            if not row.any():
+                continue
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], row.view(np.int8), [0]))))
+            for start, stop in zip(edges[::2], edges[1::2]):
+                self.runs.append((ty * t, min((ty + 1) * t, self.height), start * t, min(stop * t, self.width)))
+
+    def compose(self, img):
+        # Put the ink on top of the frame in place; cost follows the inked area
+        for y0, y1, x0, x1 in self.runs:
+            np.copyto(img[y0:y1, x0:x1], self.canvas[y0:y1, x0:x1], where=self.mask[y0:y1, x0:x1, None])
+        for overlay in self.overlays:
+            draw_shape(img, *overlay)
+        self.overlays = []
+        return img
@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+
+import landmarks
+from metrics import metrics
+
+
+class HandTracker:
+    # Pipeline inference callable that runs mediapipe on less than the full frame.
+    # factory(**settings) builds the mediapipe Hands object (mp.solutions.hands.Hands).
+    # scale < 1 downsizes the image handed to mediapipe. With roi=True, once a hand has been
+    # found only a crop around its last bounding box (plus margin) is processed; when the
+    # hand is lost, or every redetect frames to pick up new hands, the whole frame is used
+    # again. Landmarks are always returned normalized to the full-resolution frame.
+    # mediapipe's own tracking feeds each frame's landmarks to the next frame as a region in
+    # that frame's normalized coordinates, so crops and full frames can't share a graph: with
+    # roi=True crops go to their own graph, which only ever sees consecutive crops re-centred
+    # on the hand, and full frames to a static one that searches for palms afresh every time.
+    def __init__(self, factory, settings=None, scale=1.0, roi=False, margin=0.3, redetect=30):
+        self.factory = factory
+        self.settings = dict(settings or {})
+        self.base_scale = scale
+        self.scale = scale
+        self.roi = roi
+        self._build(self.settings)
+        self.margin = margin  # Fraction of the hand box size added on every side of the crop
+        self.redetect = redetect
+        self.box = None  # Last hand box in pixels (x0, y0, x1, y1)
+        self.frames_since_full = 0
+        self.requested = self.applied = {}  # Quality settings, see configure()
+
+    @property
+    def max_hands(self):
+        # Most hands a detection can hold (mediapipe's default is 2)
+        return self.settings.get("max_num_hands", 2)
+
+    def reset(self):
+        # Forget the tracked hand, the next frame is processed in full
+        self.box = None
+        self.frames_since_full = 0
+
+    def configure(self, scale=1.0, model_complexity=None, tracking_confidence=None):
+        # Quality trade-offs (see governor.py): scale multiplies the scale the tracker was
+        # created with, model_complexity and tracking_confidence replace the mediapipe settings
+        # (None keeps the tracker's own; the tracking confidence is only ever lowered).
+        # Called from any thread, applied on the inference thread before the next frame.
+        self.requested = {"scale": scale, "model_complexity": model_complexity,
+                          "tracking_confidence": tracking_confidence}
+
+    def _build(self, settings):
+        if self.roi:
+            self.hands = self.factory(**dict(settings, static_image_mode=True))
+            self.crop_hands = self.factory(**settings)
+        else:
+            self.hands = self.factory(**settings)
+            self.crop_hands = None
+        self.hands_settings = settings
+
+    def _apply(self, requested):
+        self.scale = self.base_scale * requested["scale"]
+        settings = dict(self.settings)
+        if requested["model_complexity"] is not None:
+            settings["model_complexity"] = requested["model_complexity"]
+        if requested["tracking_confidence"] is not None:
+            settings["min_tracking_confidence"] = min(settings.get("min_tracking_confidence", 0.5),
+                                                      requested["tracking_confidence"])
+        if settings != self.hands_settings:
+            # mediapipe only takes its settings when the graph is built
+            self.hands.close()
+            if self.crop_hands is not None:
+                self.crop_hands.close()
+            self._build(settings)
+            self.reset()
+        self.applied = requested
+
+    def _process(self, hands, img):
+        with metrics.stage("convert"):
+            if self.scale < 1:
+                img = cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        with metrics.stage("hands.process"):
+            results = hands.process(img)
+        return landmarks.from_results(results)
+
+    def _crop_box(self, width, height):
+        x0, y0, x1, y1 = self.box
+        # Square crop so the hand keeps its aspect ratio whatever its orientation
+        side = max(x1 - x0, y1 - y0) * (1 + 2 * self.margin)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        x0, y0 = int(max(0, cx - side / 2)), int(max(0, cy - side / 2))
+        x1, y1 = int(min(width, cx + side / 2)), int(min(height, cy + side / 2))
+        return x0, y0, x1, y1
+
+    def __call__(self, frame, t):
+        if self.requested is not self.applied:
+            self._apply(self.requested)
+        height, width = frame.shape[:2]
+        detection = None
+        if self.roi and self.box is not None and self.frames_since_full < self.redetect:
+            x0, y0, x1, y1 = self._crop_box(width, height)
+            if x1 - x0 > 16 and y1 - y0 > 16:
+                detection = self._process(self.crop_hands, frame[y0:y1, x0:x1])
+                if detection.count:
+                    # Map crop-normalized landmarks back to the full frame
+                    cw, ch = x1 - x0, y1 - y0
+                    points = detection.points * np.float32([cw / width, ch / height, cw / width])
+                    points[..., 0] += x0 / width
+                    points[..., 1] += y0 / height
+                    detection = landmarks.Detection(points, detection.right)
+                    self.frames_since_full += 1
+                else:
+                    detection = None  # Tracking lost, fall back to the whole frame
+        if detection is None:
+            detection = self._process(self.hands, frame)
+            self.frames_since_full = 0
+        if detection.count:
+            box = landmarks.bbox(landmarks.to_pixels(detection.points, width, height))
+            self.box = (box[:, 0].min(), box[:, 1].min(), box[:, 2].max(), box[:, 3].max())
+        else:
+            self.box = None
+        return detection
@@ -0,0 +1,244 @@
+import argparse
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import landmarks
+import modes
+from pipeline import FrameSource, Pipeline, open_source, run
+
+DEFAULT_NAME = "air_canvas_bus"
+MAGIC = 0x41434253  # "ACBS"
+FORMAT_VERSION = 1
+
+# Fixed header at the start of the segment, consumers read the layout from it when attaching
+HEADER_DTYPE = np.dtype([
+    ("magic", "<i8"),
+    ("version", "<i8"),
+    ("width", "<i8"),
+    ("height", "<i8"),
+    ("max_hands", "<i8"),
+    ("slots", "<i8"),
+    ("latest", "<i8"),  # Sequence number of the newest complete slot, -1 before the first frame
+    ("closed", "<i8"),
+])
+HEADER_SIZE = 64
+
+
+def slot_dtype(width, height, max_hands):
+    # One ring buffer slot: the landmark record of replay.record_dtype plus the frame.
+    # seq is -1 while the broker is writing the slot.
+    return np.dtype([
+        ("seq", "<i8"),
+        ("t", "<f8"),
+        ("count", "<i4"),
+        ("points", "<f4", (max_hands, 21, 3)),
+        ("right", "?", (max_hands,)),
+        ("frame", "u1", (height, width, 3)),
+    ], align=True)
+
+
+def _attach(name):
+    # Attaching must not register the segment with this process's resource tracker, or it
+    # would be unlinked under the broker when the consumer exits
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameBus:
+    # Shared-memory ring of the latest frames and their landmarks, written by one broker
+    # process and read by any number of consumers. read() returns read-only views into the
+    # segment (no copy); a slot stays intact for slots - 1 further frames, valid(seq) tells
+    # whether it has been overwritten since.
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+        if int(self.header["magic"]) != MAGIC or int(self.header["version"]) != FORMAT_VERSION:
+            raise ValueError("%s is not a frame bus" % shm.name)
+        self.size = (int(self.header["width"]), int(self.header["height"]))
+        self.max_hands = int(self.header["max_hands"])
+        self.slots = np.ndarray((int(self.header["slots"]),), slot_dtype(*self.size, self.max_hands),
+                                buffer=shm.buf, offset=HEADER_SIZE)
+        if not owner:
+            self.slots.flags.writeable = False
+        self.next_seq = int(self.header["latest"]) + 1
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, size=(1280, 720), max_hands=2, slots=4):
+        dtype = slot_dtype(size[0], size[1], max_hands)
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + dtype.itemsize * slots)
+        except FileExistsError:
+            # Left behind by a broker that didn't shut down cleanly
+            stale = _attach(name)
+            stale.unlink()
+            stale.close()
+            shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + dtype.itemsize * slots)
+        header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+        header[()] = (MAGIC, FORMAT_VERSION, size[0], size[1], max_hands, slots, -1, 0)
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        return cls(_attach(name), owner=False)
+
+    @property
+    def latest(self):
+        return int(self.header["latest"])
+
+    @property
+    def closed(self):
+        return bool(self.header["closed"])
+
+    def publish(self, t, frame, detection):
+        seq = self.next_seq
+        i, slots = seq % len(self.slots), self.slots
+        n = min(detection.count, self.max_hands)
+        slots["seq"][i] = -1
+        slots["t"][i] = t
+        slots["count"][i] = n
+        slots["points"][i, :n] = detection.points[:n]
+        slots["right"][i, :n] = detection.right[:n]
+        slots["frame"][i] = frame
+        slots["seq"][i] = seq
+        self.header["latest"] = seq
+        self.next_seq = seq + 1
+        return seq
+
+    def read(self, seq):
+        # (t, frame, detection) of slot seq as views into shared memory, None if it's gone
+        i, slots = seq % len(self.slots), self.slots
+        if int(slots["seq"][i]) != seq:
+            return None
+        n = int(slots["count"][i])
+        return float(slots["t"][i]), slots["frame"][i], landmarks.Detection(slots["points"][i, :n], slots["right"][i, :n])
+
+    def valid(self, seq):
+        return int(self.slots["seq"][seq % len(self.slots)]) == seq
+
+    def wait(self, after=-1, timeout=1.0, poll=0.001):
+        # Newest sequence number above `after`, or None on timeout or when the broker has closed
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.latest
+            if seq > after:
+                return seq
+            if self.closed or time.monotonic() > deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        if self.owner:
+            self.header["closed"] = 1
+        del self.header, self.slots  # Views must go before the segment can be closed
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class BusSource(FrameSource):
+    # Newest frame on the bus as a pipeline source. Frames are copied once here because modes
+    # draw on the frame they get; detect() is the matching inference callable, it returns the
+    # landmarks the broker published with the frame instead of running a detector.
+    live = True
+
+    def __init__(self, bus, size=None, timeout=5.0):
+        super().__init__(size)
+        self.bus = bus
+        self.timeout = timeout
+        self.seq = -1
+        self.t = 0.0
+        self.detections = OrderedDict()  # t -> Detection of recently read frames
+
+    def read(self):
+        while True:
+            seq = self.bus.wait(self.seq, self.timeout)
+            if seq is None:
+                return False, None
+            item = self.bus.read(seq)
+            if item is None:
+                continue  # Overwritten while we looked, take the next one
+            t, frame, detection = item
+            frame = self._fit(np.array(frame))
+            detection = landmarks.Detection(np.array(detection.points), np.array(detection.right))
+            if self.bus.valid(seq):
+                break
+        self.seq, self.t = seq, t
+        self.detections[t] = detection
+        while len(self.detections) > len(self.bus.slots):
+            self.detections.popitem(last=False)
+        return True, frame
+
+    def timestamp(self):
+        return self.t
+
+    def detect(self, frame, t):
+        detection = self.detections.get(t)
+        return landmarks.empty() if detection is None else detection
+
+
+def broker(bus, source, tracker):
+    # Owns the camera and the one detector; every processed frame is published to the bus
+    pipeline = Pipeline(source, tracker)
+    count = 0
+    try:
+        for packet in pipeline:
+            bus.publish(packet.t, packet.frame, packet.result)
+            count += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share one camera and hand detector between processes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pub = commands.add_parser("broker", help="capture, detect and publish to the bus")
+    pub.add_argument("--source", default="0")
+    pub.add_argument("--mode", default="canvas", choices=sorted(modes.MODES), help="detector settings to use")
+    pub.add_argument("--width", type=int, default=1280)
+    pub.add_argument("--height", type=int, default=720)
+    pub.add_argument("--slots", type=int, default=4)
+    pub.add_argument("--max-hands", type=int, help="hands per frame on the bus (default: what the mode's detector finds)")
+    pub.add_argument("--name", default=DEFAULT_NAME)
+    sub = commands.add_parser("run", help="run a mode on frames and landmarks from the bus")
+    sub.add_argument("mode", choices=sorted(modes.MODES))
+    sub.add_argument("--name", default=DEFAULT_NAME)
+    args = parser.parse_args(argv)
+
+    if args.command == "broker":
+        _, create_tracker = modes.load(args.mode)
+        size = (args.width, args.height)
+        tracker = create_tracker()
+        bus = FrameBus.create(args.name, size, args.max_hands or tracker.max_hands, args.slots)
+        try:
+            count = broker(bus, open_source(args.source, *size), tracker)
+        finally:
+            bus.close()
+        print("Published", count, "frames")
+        return 0
+
+    bus = FrameBus.attach(args.name)
+    try:
+        mode = modes.create(args.mode)
+        source = BusSource(bus, mode.size)
+        # The broker already mirrored the frames
+        run(mode, Pipeline(source, source.detect, flip=False))
+    finally:
+        bus.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
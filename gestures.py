@@ -0,0 +1,275 @@
+from collections import deque, namedtuple
+from functools import cached_property
+
+import numpy as np
+
+import landmarks
+from metrics import metrics
+
+# Declarative gestures evaluated on Detection arrays. Every rule turns a frame's landmarks
+# into a per-hand condition and shares one timestamp-driven state machine:
+#   hold      the condition has to hold for this many seconds (by frame timestamps, not frame
+#             counts) before the gesture fires. It fires on the first frame at or past the hold,
+#             so recognition latency is at least hold and at most hold plus one frame interval;
+#             with hold=0 it fires on the first matching frame.
+#   repeat    fire again every repeat seconds while the condition holds (None: once per hold)
+#   cooldown  after firing, no rule of the same group (the rule alone if group is None) fires
+#             for this many seconds; rules earlier in the list win within a frame
+# The time from the condition's first frame to the firing one is recorded as the metrics
+# stage "gesture <name>", so the HUD and metrics dumps show each gesture's latency.
+
+Event = namedtuple("Event", ["name", "hand", "t", "latency", "repeat"])  # hand is None for frame rules
+
+
+class Hands:
+    # Landmark features of one frame, computed on first use and shared by all rules
+    def __init__(self, detection, size):
+        self.points = detection.points
+        self.right = detection.right
+        self.count = detection.count
+        self.size = size  # (width, height) of the frame, for pixel thresholds
+        self.fingers_by_rule = {}
+
+    @cached_property
+    def pixels(self):
+        return landmarks.to_pixels(self.points, *self.size)
+
+    @cached_property
+    def centers(self):
+        return landmarks.centers(self.pixels)
+
+    def fingers(self, rule):
+        # (hands, 5) bool by one of the finger rules of landmarks.py:
+        #   up            fingers_up with the thumb rule following each hand's handedness
+        #   up-unhanded   fingers_up with the left-hand thumb rule for every hand
+        #   extended      fingers_extended (palm-size relative)
+        cache = self.fingers_by_rule
+        if rule not in cache:
+            if rule == "up":
+                cache[rule] = landmarks.fingers_up(self.points, self.right)
+            elif rule == "up-unhanded":
+                cache[rule] = landmarks.fingers_up(self.points)
+            elif rule == "extended":
+                cache[rule] = landmarks.fingers_extended(self.points)
+            else:
+                raise ValueError("Unknown finger rule %r" % rule)
+        return cache[rule]
+
+
+class Rule:
+    # Base class: match() returns the condition of every hand, (hands,) bool, or (1,) bool for
+    # rules with scope "frame" that look at all hands together. begin() gives the timestamp
+    # each held condition started at, which hold and the latency are measured from.
+    scope = "hand"
+
+    def __init__(self, name, hold=0.0, repeat=None, cooldown=0.0, group=None):
+        self.name = name
+        self.hold = hold
+        self.repeat = repeat
+        self.cooldown = cooldown
+        self.group = group or name
+        self.stage = "gesture " + name
+
+    def match(self, hands, t, active):
+        # active: (hands,) bool, whether the gesture is currently held (for hysteresis)
+        raise NotImplementedError
+
+    def begin(self, cond, since, t):
+        # since: start timestamps from the previous frame, NaN where the condition didn't hold
+        return np.where(cond, np.where(np.isnan(since), t, since), np.nan)
+
+    def fired(self, hand, t):
+        pass
+
+    def reset(self):
+        pass
+
+
+class Pose(Rule):
+    # Finger pattern and/or finger count, optionally with the hand centre inside region
+    # (x0, y0, x1, y1 in pixels). fingers is thumb..pinky with 1 up, 0 down, None either way.
+    # count is an exact number of fingers up or an inclusive (low, high) range; with
+    # scope="frame" it is counted over all hands together.
+    def __init__(self, name, fingers=None, count=None, rule="up", region=None, scope="hand", **timing):
+        super().__init__(name, **timing)
+        self.rule = rule
+        self.scope = scope
+        self.region = region
+        self.count = (count, count) if isinstance(count, int) else count
+        if fingers is not None:
+            self.care = np.array([f is not None for f in fingers])
+            self.fingers = np.array([bool(f) for f in fingers])
+        else:
+            self.care = None
+
+    def match(self, hands, t, active):
+        up = hands.fingers(self.rule)
+        if self.scope == "frame":
+            total = int(up.sum())
+            return np.array([self.count is not None and self.count[0] <= total <= self.count[1]])
+        cond = np.ones(len(up), bool)
+        if self.care is not None:
+            cond &= (up[:, self.care] == self.fingers[self.care]).all(axis=1)
+        if self.count is not None:
+            total = up.sum(axis=1)
+            cond &= (total >= self.count[0]) & (total <= self.count[1])
+        if self.region is not None:
+            x0, y0, x1, y1 = self.region
+            cx, cy = hands.centers[:, 0], hands.centers[:, 1]
+            cond &= (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+        return cond
+
+
+class Pinch(Rule):
+    # Landmarks a and b closer than distance pixels. Once held, the pinch only ends when they
+    # are further apart than release, so a distance near the threshold doesn't flicker.
+    def __init__(self, name, a=landmarks.THUMB_TIP, b=landmarks.INDEX_TIP, distance=25, release=None, **timing):
+        super().__init__(name, **timing)
+        self.a, self.b = a, b
+        self.distance = distance
+        self.release = distance * 1.5 if release is None else release
+
+    def match(self, hands, t, active):
+        d = landmarks.distance(hands.pixels, self.a, self.b)
+        return d < np.where(active, self.release, self.distance)
+
+
+class Offset(Rule):
+    # Landmark b at least distance pixels past landmark a along axis (0: x, 1: y);
+    # a negative distance means before it
+    def __init__(self, name, a, b, distance, axis=1, **timing):
+        super().__init__(name, **timing)
+        self.a, self.b = a, b
+        self.distance = distance
+        self.axis = axis
+
+    def match(self, hands, t, active):
+        px = hands.pixels
+        d = px[:, self.b, self.axis] - px[:, self.a, self.axis]
+        return d >= self.distance if self.distance >= 0 else d <= self.distance
+
+
+DIRECTIONS = {"left": (-1, 0), "right": (1, 0), "up": (0, -1), "down": (0, 1)}
+
+
+class Swipe(Rule):
+    # Landmark moving in direction by at least distance pixels within the last window seconds,
+    # at an average of at least velocity pixels per second. Every sample in the window is tried
+    # as the start of the motion, so slow drift before a flick doesn't water down its speed;
+    # the swipe is timed from the latest start that qualifies. Positions are kept with their
+    # timestamps, so the thresholds mean the same at any frame rate. After a swipe fires the
+    # motion so far is forgotten, the next one is measured from the frame after it.
+    def __init__(self, name, direction, distance=60, velocity=1000, landmark=landmarks.INDEX_TIP, window=0.25,
+                 **timing):
+        timing.setdefault("cooldown", 0.3)
+        super().__init__(name, **timing)
+        self.direction = np.array(DIRECTIONS[direction], np.float32)
+        self.distance = distance
+        self.velocity = velocity
+        self.landmark = landmark
+        self.window = window
+        self.history = deque()  # (t, (hands, 2) positions), all with the same number of hands
+        self.start = None  # (hands,) time up to which a hand's samples are ignored
+        self.first = None  # (hands,) time of the sample each hand's swipe started at
+
+    def reset(self):
+        self.history.clear()
+        self.start = None
+
+    def match(self, hands, t, active):
+        positions = hands.pixels[:, self.landmark].astype(np.float32)
+        if self.history and len(self.history[-1][1]) != len(positions):
+            self.reset()  # Hands came or went, old positions don't line up any more
+        if self.start is None:
+            self.start = np.full(len(positions), -np.inf)
+        self.history.append((t, positions))
+        while self.history[0][0] < t - self.window:
+            self.history.popleft()
+        times = np.array([sample[0] for sample in self.history])
+        # (samples, hands) motion from every sample in the window up to now
+        along = (positions - np.stack([sample[1] for sample in self.history])) @ self.direction
+        dt = (t - times)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            swiped = ((times[:, None] > self.start) & (dt > 0) & (along >= self.distance)
+                      & (along / dt >= self.velocity))
+        latest = len(times) - 1 - np.argmax(swiped[::-1], axis=0)
+        self.first = times[latest]
+        return swiped.any(axis=0)
+
+    def begin(self, cond, since, t):
+        # A swipe started where its motion did
+        return np.where(cond, self.first, np.nan)
+
+    def fired(self, hand, t):
+        self.start[hand] = t
+
+
+class State:
+    # Per-hand state of one rule
+    def __init__(self, hands):
+        self.since = np.full(hands, np.nan)  # Timestamp the condition started
+        self.last = np.full(hands, np.nan)  # Timestamp the gesture last fired during this hold
+        self.active = np.zeros(hands, bool)  # Held for at least hold
+
+
+class GestureEngine:
+    # Runs a list of rules over every frame's Detection. update() returns the gestures that
+    # fired on this frame as Events; holding(name, hand) tells whether a hand currently holds a
+    # gesture, for continuous ones like drawing. Hand-scope state is per hand index and starts
+    # over when the number of hands changes.
+    def __init__(self, rules):
+        self.rules = list(rules)
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Gesture names must be unique")
+        self.states = {rule.name: State(0) for rule in self.rules}
+        self.blocked = {}  # Group -> timestamp until which it can't fire
+
+    def reset(self):
+        for rule in self.rules:
+            rule.reset()
+            self.states[rule.name] = State(0)
+        self.blocked = {}
+
+    def update(self, detection, t, size):
+        hands = Hands(detection, size)
+        events = []
+        for rule in self.rules:
+            events += self._update(rule, hands, t)
+        return events
+
+    def _update(self, rule, hands, t):
+        if rule.scope == "hand" and not hands.count:
+            rule.reset()
+            self.states[rule.name] = State(0)
+            return []
+        state = self.states[rule.name]
+        n = 1 if rule.scope == "frame" else hands.count
+        if len(state.since) != n:
+            state = self.states[rule.name] = State(n)
+        cond = rule.match(hands, t, state.active)
+        since = rule.begin(cond, state.since, t)
+        held = cond & (t - since >= rule.hold)
+        last = np.where(cond, state.last, np.nan)
+        due = held & np.isnan(last)
+        if rule.repeat is not None:
+            due |= held & (t - last >= rule.repeat)
+        if t < self.blocked.get(rule.group, -np.inf):
+            due[:] = False
+        events = []
+        for hand in np.flatnonzero(due).tolist():
+            repeat = not np.isnan(last[hand])
+            latency = t - since[hand] if not repeat else t - (last[hand] + rule.repeat)
+            if not repeat:
+                metrics.record(rule.stage, latency)
+            events.append(Event(rule.name, hand if rule.scope == "hand" else None, t, latency, repeat))
+            last[hand] = t
+            rule.fired(hand, t)
+        if events and rule.cooldown:
+            self.blocked[rule.group] = t + rule.cooldown
+        state.since, state.last, state.active = since, last, held
+        return events
+
+    def holding(self, name, hand=0):
+        active = self.states[name].active
+        return bool(active[hand]) if hand < len(active) else False
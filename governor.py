@@ -0,0 +1,169 @@
+import os
+import time
+from collections import namedtuple
+
+import cv2
+
+from metrics import metrics
+
+# One step of the quality ladder. capture multiplies the camera resolution and scale the
+# tracker's own inference scale; model_complexity and tracking_confidence go to mediapipe
+# (None keeps the tracker's setting). Ordered from best to cheapest, each level giving up
+# what costs the least accuracy for the time it saves. Every level only makes detection
+# cheaper, nothing on the render side.
+Level = namedtuple("Level", ["name", "capture", "model_complexity", "scale", "tracking_confidence"])
+
+LEVELS = (
+    Level("full", 1.0, None, 1.0, None),
+    Level("lite model", 1.0, 0, 1.0, None),
+    Level("fewer redetections", 1.0, 0, 1.0, 0.3),  # mediapipe reruns palm detection less often
+    Level("half inference", 1.0, 0, 0.5, 0.3),
+    Level("half capture", 0.5, 0, 0.5, 0.3),
+)
+
+# Metrics stages that make up the time per frame of each pipeline thread. The detector stages
+# are timed per detection, so behind a DecimatedTracker they count what a detection costs and
+# not the average over the frames it skips; "inference" is used for other trackers.
+DETECT_STAGES = ("convert", "hands.process")
+RENDER_STAGES = ("step", "display")
+
+
+class QualityGovernor:
+    # Keeps a pipeline within the frame budget of target_fps by moving along `levels`.
+    # Every `interval` seconds it measures the frame cost: the mean time per frame of the
+    # inference thread since the last check. Unlike the frame interval this doesn't include
+    # waiting for the camera, so a camera that delivers fewer frames doesn't make the governor
+    # give up quality for nothing; and since the levels only make detection cheaper, a slow
+    # render thread (measured for the HUD) doesn't either. Levels that lower the capture
+    # resolution are left out for sources that resize frames to a fixed size, where they would
+    # only be scaled back up.
+    # Hysteresis: one level down after `down` checks in a row above budget * high, one level
+    # up after `up` checks in a row below budget * low, and the checks right after a change are
+    # skipped while the new settings take effect. A level that has to be left again soon after
+    # the governor moved up to it doubles the wait before the next attempt (up to 8 * up).
+    def __init__(self, pipeline, target_fps=30, levels=LEVELS, interval=0.5, high=1.0, low=0.6, down=3, up=10):
+        self.pipeline = pipeline
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        if pipeline.source.size is not None:
+            levels = tuple(level for level in levels if level.capture == 1.0)
+        self.levels = levels
+        self.interval = interval
+        self.high, self.low = high, low
+        self.down = down
+        self.up = [up] * len(levels)  # Checks below budget needed to leave each level upwards
+        self.max_up = 8 * up
+        self.index = 0
+        self.over = self.under = 0
+        self.skip = 0
+        self.checks = 0
+        self.raised_at = None  # Check of the last move up
+        self.changes = 0
+        self.cost = None  # Last measured frame cost (inference) in seconds
+        self.render_cost = None  # Same for the render thread, shown but not acted on
+        self.seen = {}  # stage -> (stats, count, total) at the last check
+        self.next_check = time.monotonic() + interval
+        self._apply()
+
+    @classmethod
+    def from_env(cls, pipeline, var="AIR_CANVAS_TARGET_FPS", default=30):
+        # Governor for the target frame rate in the environment variable (default if unset),
+        # None if it is 0
+        value = os.environ.get(var)
+        target_fps = float(value) if value else default
+        return cls(pipeline, target_fps) if target_fps > 0 else None
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def _apply(self):
+        level = self.level
+        self.pipeline.source.set_capture(level.capture)
+        if hasattr(self.pipeline.infer, "configure"):
+            self.pipeline.infer.configure(scale=level.scale, model_complexity=level.model_complexity,
+                                          tracking_confidence=level.tracking_confidence)
+        self.over = self.under = 0
+        self.skip = 2  # One check still sees the old settings, the next one pays for the model rebuild
+
+    def _mean(self, name):
+        # Mean time of a stage since the last check, None without new samples
+        stats = metrics.stats.get(name)
+        if stats is None:
+            return None
+        last, count, total = self.seen.get(name, (None, 0, 0.0))
+        if last is not stats:  # metrics.reset() replaced it
+            count, total = 0, 0.0
+        self.seen[name] = (stats, stats.count, stats.total)
+        n = stats.count - count
+        return (stats.total - total) / n if n > 0 else None
+
+    def _cost(self):
+        # (inference, render) time per frame, None where there were no new frames
+        detect = [self._mean(name) for name in DETECT_STAGES]
+        render = [self._mean(name) for name in RENDER_STAGES]
+        inference = self._mean("inference")
+        if detect[-1] is not None:
+            inference = sum(mean for mean in detect if mean is not None)
+        if render[0] is not None:
+            render = sum(mean for mean in render if mean is not None)
+        else:
+            render = None
+        return inference, render
+
+    def update(self):
+        # Called once per rendered frame, does its work every interval seconds
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.interval
+        cost, render = self._cost()
+        if render is not None:
+            self.render_cost = render
+        if cost is None:
+            return
+        self.cost = cost
+        self.checks += 1
+        if self.skip:
+            self.skip -= 1
+            return
+        if cost > self.budget * self.high:
+            self.over, self.under = self.over + 1, 0
+        elif cost < self.budget * self.low:
+            self.over, self.under = 0, self.under + 1
+        else:
+            self.over = self.under = 0
+        if self.over >= self.down and self.index + 1 < len(self.levels):
+            if self.raised_at is not None and self.checks - self.raised_at < 2 * self.up[self.index + 1]:
+                # Moving up from there didn't hold, wait longer next time
+                self.up[self.index + 1] = min(2 * self.up[self.index + 1], self.max_up)
+            self.raised_at = None
+            self._change(self.index + 1)
+        elif self.under >= self.up[self.index] and self.index > 0:
+            self.raised_at = self.checks
+            self._change(self.index - 1)
+
+    def _change(self, index):
+        self.index = index
+        self.changes += 1
+        self._apply()
+        print("Quality level %d/%d: %s (frame cost %.1f ms, budget %.1f ms)"
+              % (index, len(self.levels) - 1, self.level.name, self.cost * 1000, self.budget * 1000))
+
+    def status(self):
+        return dict(self.level._asdict(), level=self.index, levels=len(self.levels), target_fps=self.target_fps,
+                    budget_ms=self.budget * 1000, cost_ms=self.cost * 1000 if self.cost is not None else None,
+                    render_ms=self.render_cost * 1000 if self.render_cost is not None else None,
+                    changes=self.changes)
+
+    def draw(self, img):
+        # Current level in the bottom-left corner, drawn with the timing HUD
+        line = "quality %d/%d %s" % (self.index, len(self.levels) - 1, self.level.name)
+        if self.cost is not None:
+            line += "  %.1f/%.1f ms" % (self.cost * 1000, self.budget * 1000)
+        if self.render_cost is not None:
+            line += "  render %.1f ms" % (self.render_cost * 1000)
+        origin = (10, img.shape[0] - 12)
+        cv2.putText(img, line, origin, cv2.FONT_HERSHEY_PLAIN, 1.1, (0, 0, 0), 3)
+        cv2.putText(img, line, origin, cv2.FONT_HERSHEY_PLAIN, 1.1, (255, 255, 255), 1)
+        return img
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+
+class RecordingBackend:
+    # Stand-in for pyautogui that records every call instead of touching the OS (headless runs).
+    # The dispatcher hands it each event's own timestamp through record_call, so replaying a
+    # recording always produces the same log; direct calls are stamped with the clock.
+    def __init__(self, screen_size=(1920, 1080)):
+        self.screen_size = screen_size
+        self.calls = []  # (time, name, args)
+
+    def size(self):
+        return self.screen_size
+
+    def record_call(self, name, args, now=None):
+        self.calls.append((time.monotonic() if now is None else now, name, tuple(args)))
+
+    def _record(self, name, *args):
+        self.record_call(name, args)
+
+    def moveTo(self, x, y):
+        self._record("moveTo", x, y)
+
+    def scroll(self, amount):
+        self._record("scroll", amount)
+
+    def press(self, key):
+        self._record("press", key)
+
+    def click(self):
+        self._record("click")
+
+
+class InputDispatcher:
+    # Sends mouse and keyboard events to the OS from a worker thread so the vision loop never
+    # waits on them. Pending cursor moves are merged into the latest one, scrolls and key
+    # presses are rate limited and clicks are debounced by timestamp (no sleeping).
+    # Events are accepted or dropped immediately in the caller's thread; callers replaying
+    # recorded input pass now= so rate limiting follows the recorded timestamps, and
+    # threaded=False to call the backend directly so the event log is deterministic.
+    def __init__(self, backend=None, scroll_interval=0.05, key_interval=0.3, click_interval=0.2, threaded=True):
+        if backend is None:
+            import pyautogui
+            pyautogui.PAUSE = 0  # The worker does its own pacing
+            backend = pyautogui
+        self.backend = backend
+        self.scroll_interval = scroll_interval
+        self.key_interval = key_interval  # Per key
+        self.click_interval = click_interval
+        self.events = deque()
+        self.move = None  # Latest cursor position not sent yet
+        self.last_scroll = float("-inf")
+        self.last_keys = {}
+        self.last_click = float("-inf")
+        self.dropped = 0
+        self.cond = threading.Condition()
+        self.threaded = threaded
+        self.running = True
+        self.worker = None
+        if threaded:
+            self.worker = threading.Thread(target=self._work, daemon=True)
+            self.worker.start()
+
+    def size(self):
+        return self.backend.size()
+
+    def move_to(self, x, y, now=None):
+        if not self.threaded:
+            return self._send("moveTo", (x, y), now)
+        with self.cond:
+            if self.move is not None:
+                self.dropped += 1
+            self.move = ((x, y), now)
+            self.cond.notify()
+
+    def _submit(self, name, args, now):
+        if not self.threaded:
+            return self._send(name, args, now)
+        with self.cond:
+            # A pending move goes first so the event lands where the cursor was asked to be
+            if self.move is not None:
+                self.events.append(("moveTo",) + self.move)
+                self.move = None
+            self.events.append((name, args, now))
+            self.cond.notify()
+
+    def scroll(self, amount, now=None):
+        now = time.monotonic() if now is None else now
+        if amount == 0 or now - self.last_scroll < self.scroll_interval:
+            self.dropped += 1
+            return False
+        self.last_scroll = now
+        self._submit("scroll", (amount,), now)
+        return True
+
+    def press(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self.last_keys.get(key, float("-inf")) < self.key_interval:
+            self.dropped += 1
+            return False
+        self.last_keys[key] = now
+        self._submit("press", (key,), now)
+        return True
+
+    def click(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self.last_click < self.click_interval:
+            self.dropped += 1
+            return False
+        self.last_click = now
+        self._submit("click", (), now)
+        return True
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while self.running and not self.events and self.move is None:
+                    self.cond.wait()
+                if self.events:
+                    name, args, now = self.events.popleft()
+                elif self.move is not None:
+                    args, now = self.move
+                    name, self.move = "moveTo", None
+                else:
+                    return
+            self._send(name, args, now)
+
+    def _send(self, name, args, now=None):
+        try:
+            if isinstance(self.backend, RecordingBackend):
+                self.backend.record_call(name, args, now)
+            else:
+                getattr(self.backend, name)(*args)
+        except Exception as e:
+            print("Input event failed:", name, e)
+        if self.threaded and now is not None:
+            # Gesture (frame capture time) to OS action
+            metrics.record("action", time.monotonic() - now)
+
+    def close(self):
+        # Sends whatever is still queued, then stops the worker
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.worker is not None:
+            self.worker.join(timeout=2)
@@ -0,0 +1,147 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Landmark ids used by the scripts
+WRIST = 0
+THUMB_IP, THUMB_TIP = 3, 4
+INDEX_MCP, INDEX_TIP = 5, 8
+MIDDLE_MCP, MIDDLE_TIP = 9, 12
+RING_MCP, RING_TIP = 13, 16
+PINKY_MCP, PINKY_TIP = 17, 20
+
+TIPS = np.array([THUMB_TIP, INDEX_TIP, MIDDLE_TIP, RING_TIP, PINKY_TIP])
+MCPS = np.array([INDEX_MCP, MIDDLE_MCP, RING_MCP, PINKY_MCP])
+
+# Same pairs as mediapipe's HAND_CONNECTIONS
+HAND_CONNECTIONS = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 4), (0, 5), (5, 6), (6, 7), (7, 8), (5, 9), (9, 10), (10, 11),
+    (11, 12), (9, 13), (13, 14), (14, 15), (15, 16), (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),
+])
+
+
+class Detection(namedtuple("Detection", ["points", "right"])):
+    # points: (hands, 21, 3) float32 landmarks normalized to the frame (x, y in 0..1)
+    # right: (hands,) bool, True where mediapipe labelled the hand "Right"
+    __slots__ = ()
+
+    @property
+    def count(self):
+        return len(self.points)
+
+
+def empty():
+    return Detection(np.zeros((0, 21, 3), np.float32), np.zeros(0, bool))
+
+
+def from_results(results):
+    # The only per-landmark Python loop: one pass over the protobuf per frame
+    if not results.multi_hand_landmarks:
+        return empty()
+    points = np.array([[(lm.x, lm.y, lm.z) for lm in hand.landmark] for hand in results.multi_hand_landmarks],
+                      np.float32)
+    right = np.array([hand.classification[0].label == "Right" for hand in results.multi_handedness], bool)
+    return Detection(points, right)
+
+
+def to_pixels(points, width, height):
+    # int32 pixel (or screen) coordinates of any landmarks: (hands, 21, 2) for all of them,
+    # (hands, 2) for a slice like points[:, INDEX_TIP]
+    return (points[..., :2] * (width, height)).astype(np.int32)
+
+
+def fingers_up(points, right=None):
+    # (hands, 5) bool in thumb, index, middle, ring, pinky order.
+    # A finger is up when its tip is above the joint two landmarks below it. The thumb is
+    # checked horizontally: with right=None every hand uses the left-hand rule (tip right of
+    # the IP joint), otherwise the direction is flipped for hands labelled "Right".
+    up = np.empty((len(points), 5), bool)
+    up[:, 1:] = points[:, TIPS[1:], 1] < points[:, TIPS[1:] - 2, 1]
+    thumb = points[:, THUMB_TIP, 0] > points[:, THUMB_IP, 0]
+    if right is not None:
+        thumb = thumb != right
+    up[:, 0] = thumb
+    return up
+
+
+def fingers_extended(points):
+    # (hands, 5) bool, palm-size relative rule: a finger counts when its tip is further above
+    # its knuckle than half the wrist-to-middle-knuckle distance
+    thresh = (points[:, WRIST, 1] - points[:, MIDDLE_MCP, 1]) / 2
+    up = np.empty((len(points), 5), bool)
+    up[:, 1:] = (points[:, MCPS, 1] - points[:, TIPS[1:], 1]) > thresh[:, None]
+    up[:, 0] = (points[:, INDEX_MCP, 0] - points[:, THUMB_TIP, 0]) * 100 > 6
+    return up
+
+
+def distance(px, a, b):
+    # (hands,) distance between landmarks a and b of every hand (pinch distance for 4 and 8)
+    return np.linalg.norm((px[:, a] - px[:, b]).astype(np.float32), axis=-1)
+
+
+def bbox(px):
+    # (hands, 4) x0, y0, x1, y1
+    return np.concatenate([px.min(axis=1), px.max(axis=1)], axis=1)
+
+
+def centers(px):
+    # (hands, 2) centre of each hand's bounding box
+    box = bbox(px)
+    return (box[:, :2] + box[:, 2:]) // 2
+
+
+def match(previous, current, max_distance=np.inf):
+    # For each current point, the index of the previous point it continues (-1 for none).
+    # Nearest pairs are taken first; the loop only runs over the few hands in view.
+    found = np.full(len(current), -1)
+    if not len(previous) or not len(current):
+        return found
+    dist = np.linalg.norm(current[:, None, :2] - previous[None, :, :2], axis=2)
+    taken = np.zeros(len(previous), bool)
+    for flat in np.argsort(dist, axis=None).tolist():
+        i, j = divmod(flat, len(previous))
+        if dist[i, j] > max_distance:
+            break
+        if found[i] < 0 and not taken[j]:
+            found[i] = j
+            taken[j] = True
+    return found
+
+
+class HandIds:
+    # Stable ids for the hands of consecutive frames, matched by nearest hand centre (within
+    # max_distance pixels). A hand that is not seen keeps its id for `keep` frames, so a
+    # short detection drop doesn't turn it into a new hand. ids holds all live ids.
+    def __init__(self, max_distance=150, keep=15):
+        self.max_distance = max_distance
+        self.keep = keep
+        self.centers = np.zeros((0, 2))
+        self.ids = np.zeros(0, int)
+        self.age = np.zeros(0, int)  # Frames since each id was last seen
+        self.next_id = 0
+
+    def __call__(self, centers):
+        previous = match(self.centers, centers, self.max_distance)
+        ids = np.full(len(centers), -1)
+        ids[previous >= 0] = self.ids[previous[previous >= 0]]
+        new = ids < 0
+        ids[new] = np.arange(self.next_id, self.next_id + new.sum())
+        self.next_id += int(new.sum())
+        lost = np.ones(len(self.ids), bool)
+        lost[previous[previous >= 0]] = False
+        lost &= self.age < self.keep
+        self.centers = np.concatenate([centers, self.centers[lost]])
+        self.ids = np.concatenate([ids, self.ids[lost]])
+        self.age = np.concatenate([np.zeros(len(ids), int), self.age[lost] + 1])
+        return ids
+
+
+def draw(img, px, color=(0, 255, 0), joint_color=(0, 0, 255)):
+    # Landmarks and connections of every hand
+    if len(px) == 0:
+        return img
+    cv2.polylines(img, list(px[:, HAND_CONNECTIONS].reshape(-1, 2, 2)), False, color, 2)
+    for x, y in px.reshape(-1, 2).tolist():
+        cv2.circle(img, (x, y), 4, joint_color, cv2.FILLED)
+    return img
@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class LatencyStats:
+    # Last `window` samples of one stage in a ring buffer; percentiles are computed on demand
+    def __init__(self, window=1000):
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        recent = self.samples[:min(self.count, len(self.samples))]
+        if not len(recent):
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99]) * 1000
+        return {"count": self.count, "mean_ms": recent.mean() * 1000, "p50_ms": p50, "p95_ms": p95,
+                "p99_ms": p99, "max_ms": recent.max() * 1000}
+
+
+class _Stage:
+    # Reusable timer so `with metrics.stage(name):` allocates nothing on the hot path
+    __slots__ = ("stats", "start")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add(time.perf_counter() - self.start)
+
+
+class Metrics:
+    # Per-stage timers, frame rate and end-to-end latency for the whole process. Each stage
+    # is expected to be timed from one thread (capture, inference, render, ...).
+    def __init__(self, window=1000):
+        self.window = window
+        self.stats = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.frame_times = LatencyStats(window)
+        self.last_frame = None
+        self.hud_lines = []
+        self.hud_updated = 0.0
+
+    def _stats(self, name):
+        stats = self.stats.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.stats.setdefault(name, LatencyStats(self.window))
+        return stats
+
+    def stage(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = _Stage(self._stats(name))
+        return timer
+
+    def record(self, name, seconds):
+        self._stats(name).add(seconds)
+
+    def tick(self):
+        # Called once per rendered frame
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.add(now - self.last_frame)
+        self.last_frame = now
+        self.frames += 1
+
+    @property
+    def fps(self):
+        recent = self.frame_times.samples[:min(self.frame_times.count, self.window)]
+        return 1.0 / recent.mean() if len(recent) and recent.mean() > 0 else 0.0
+
+    def snapshot(self):
+        with self.lock:
+            names = list(self.stats)
+        return {"frames": self.frames, "fps": self.fps,
+                "stages": {name: self.stats[name].summary() for name in names}}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.timers = {}
+        self.frames = 0
+        self.frame_times = LatencyStats(self.window)
+        self.last_frame = None
+
+    def draw_hud(self, img, origin=(10, 130), interval=0.5):
+        # Text is rebuilt every `interval` seconds, in between the cached lines are just drawn
+        now = time.monotonic()
+        if now - self.hud_updated > interval:
+            self.hud_updated = now
+            snapshot = self.snapshot()
+            self.hud_lines = ["%.1f fps" % snapshot["fps"]]
+            for name, s in snapshot["stages"].items():
+                if s["count"]:
+                    self.hud_lines.append("%-12s %6.1f %6.1f %6.1f ms" % (name, s["p50_ms"], s["p95_ms"], s["p99_ms"]))
+        x, y = origin
+        for i, line in enumerate(self.hud_lines):
+            cv2.putText(img, line, (x, y + 18 * i), cv2.FONT_HERSHEY_PLAIN, 1.1, (0, 0, 0), 3)
+            cv2.putText(img, line, (x, y + 18 * i), cv2.FONT_HERSHEY_PLAIN, 1.1, (255, 255, 255), 1)
+        return img
+
+
+# Process-wide instance used by the pipeline, trackers, modes and the input dispatcher
+metrics = Metrics()
@@ -0,0 +1,34 @@
+import importlib
+
+from input_dispatch import InputDispatcher, RecordingBackend
+
+# Mode name -> (module, class). Modules are imported on first use so that e.g. the slide
+# mode can run without pulling in the input dispatcher backend of the system mode.
+MODES = {
+    "canvas": ("air_canvas", "AirCanvas"),
+    "slides": ("pmp", "SlideShow"),
+    "system": ("proj3a", "SystemControl"),
+    "gestures": ("aircanvas", "GestureKeys"),
+}
+
+
+def load(name):
+    # (mode class, create_tracker function) for a mode name
+    module_name, class_name = MODES[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name), module.create_tracker
+
+
+def create(name, headless=False):
+    # Headless modes send OS input to a RecordingBackend (synchronously, so the event log is
+    # deterministic) and don't read or write saved drawings or annotations
+    cls, _ = load(name)
+    if not headless:
+        return cls()
+    if name in ("system", "gestures"):
+        return cls(dispatcher=InputDispatcher(RecordingBackend(), threaded=False))
+    if name == "slides":
+        return cls(annotations_path=None)
+    if name == "canvas":
+        return cls(session_path=None)
+    return cls()
@@ -0,0 +1,140 @@
+import cv2
+import numpy as np
+
+
+class Button:
+    # Filled box with a label; extra keyword data (tool, color, ...) is kept on the button.
+    # name, rect and color are positional-only so that data can have its own color.
+    def __init__(self, name, rect, color, /, label=None, text_color=(255, 255, 255), text_offset=(10, 69), **data):
+        self.name = name
+        self.rect = rect  # (x0, y0, x1, y1)
+        self.color = color
+        self.label = name if label is None else label
+        self.text_color = text_color
+        self.text_offset = text_offset
+        self.data = data
+
+    @property
+    def bounds(self):
+        return self.rect
+
+    @property
+    def hit_rect(self):
+        # Same strict bounds the old if/elif chain used: x0 < x < x1 and y < y1
+        x0, y0, x1, y1 = self.rect
+        return x0 + 1, 0, x1, y1
+
+    def draw(self, img, mask, active=False, offset=(0, 0)):
+        # offset is the frame position of img's top-left corner
+        x0, y0, x1, y1 = self.rect
+        x0, x1, y0, y1 = x0 - offset[0], x1 - offset[0], y0 - offset[1], y1 - offset[1]
+        for target, color in ((img, self.color), (mask, 255)):
+            cv2.rectangle(target, (x0, y0), (x1, y1), color, cv2.FILLED)
+        cv2.putText(img, self.label, (x0 + self.text_offset[0], y0 + self.text_offset[1]),
+                    cv2.FONT_HERSHEY_PLAIN, 2, self.text_color, 2)
+        if active:
+            cv2.rectangle(img, (x0 + 2, y0 + 2), (x1 - 2, y1 - 2), (255, 255, 255), 3)
+
+
+class Line:
+    def __init__(self, name, p1, p2, color, thickness):
+        self.name = name
+        self.p1, self.p2 = p1, p2
+        self.color = color
+        self.thickness = thickness
+
+    @property
+    def bounds(self):
+        pad = self.thickness // 2 + 1
+        return (min(self.p1[0], self.p2[0]) - pad, min(self.p1[1], self.p2[1]) - pad,
+                max(self.p1[0], self.p2[0]) + pad, max(self.p1[1], self.p2[1]) + pad)
+
+    hit_rect = None  # Lines are decoration only
+
+    def draw(self, img, mask, active=False, offset=(0, 0)):
+        p1 = (self.p1[0] - offset[0], self.p1[1] - offset[1])
+        p2 = (self.p2[0] - offset[0], self.p2[1] - offset[1])
+        for target, color in ((img, self.color), (mask, 255)):
+            cv2.line(target, p1, p2, color, self.thickness)
+
+
+class Overlay:
+    # Static UI rendered once into a cached sprite (BGR image plus mask) and blended into
+    # each frame with a single copyto. Hit-testing is a lookup table over the sprite area
+    # holding the index of the widget under every pixel, so it costs the same for any number
+    # of widgets. Only widgets whose state changes (the active ones) get re-rendered.
+    def __init__(self, widgets, size):
+        self.widgets = list(widgets)
+        self.index = {widget.name: i for i, widget in enumerate(self.widgets)}
+        width, height = size
+        rects = [widget.bounds for widget in self.widgets]
+        rects += [widget.hit_rect for widget in self.widgets if widget.hit_rect is not None]
+        self.x0, self.y0 = max(0, min(r[0] for r in rects)), max(0, min(r[1] for r in rects))
+        self.x1, self.y1 = min(width, max(r[2] for r in rects) + 1), min(height, max(r[3] for r in rects) + 1)
+        shape = (self.y1 - self.y0, self.x1 - self.x0)
+        self.image = np.zeros(shape + (3,), np.uint8)
+        self.mask = np.zeros(shape, np.uint8)
+        self.lut = np.full(shape, -1, np.int16)
+        for i, widget in enumerate(self.widgets):
+            if widget.hit_rect is not None:
+                x0, y0, x1, y1 = widget.hit_rect
+                self.lut[max(0, y0 - self.y0):max(0, y1 - self.y0), max(0, x0 - self.x0):max(0, x1 - self.x0)] = i
+        self.active = set()  # Indices of the highlighted widgets
+        for i in range(len(self.widgets)):
+            self._render(i)
+        self.where = self.mask[..., None].astype(bool)
+
+    def _render(self, i):
+        widget = self.widgets[i]
+        x0, y0, x1, y1 = widget.bounds
+        x0, y0 = max(x0, self.x0), max(y0, self.y0)
+        x1, y1 = min(x1 + 1, self.x1), min(y1 + 1, self.y1)
+        ys, xs = slice(y0 - self.y0, y1 - self.y0), slice(x0 - self.x0, x1 - self.x0)
+        image, mask = np.zeros((y1 - y0, x1 - x0, 3), np.uint8), np.zeros((y1 - y0, x1 - x0), np.uint8)
+        widget.draw(image, mask, active=(i in self.active), offset=(x0, y0))
+        np.copyto(self.image[ys, xs], image, where=mask[..., None].astype(bool))
+        self.mask[ys, xs] |= mask
+
+    def set_active(self, *names):
+        # Highlight exactly the named widgets
+        active = {self.index[name] for name in names if name in self.index}
+        if active == self.active:
+            return
+        previous, self.active = self.active, active
+        for i in sorted(previous ^ active):
+            self._render(i)
+
+    def hit(self, x, y):
+        # Widget under (x, y) or None
+        if not (self.x0 <= x < self.x1 and self.y0 <= y < self.y1):
+            return None
+        i = self.lut[y - self.y0, x - self.x0]
+        return self.widgets[i] if i >= 0 else None
+
+    def blit(self, img):
+        np.copyto(img[self.y0:self.y1, self.x0:self.x1], self.image, where=self.where)
+        return img
+
+
+class Stamp:
+    # Pre-rendered filled circle that is blitted at a position instead of calling cv2.circle
+    def __init__(self, radius, color):
+        size = 2 * radius + 1
+        self.radius = radius
+        self.image = np.zeros((size, size, 3), np.uint8)
+        mask = np.zeros((size, size), np.uint8)
+        cv2.circle(self.image, (radius, radius), radius, color, cv2.FILLED)
+        cv2.circle(mask, (radius, radius), radius, 255, cv2.FILLED)
+        self.where = mask[..., None].astype(bool)
+
+    def draw(self, img, center):
+        r = self.radius
+        x, y = int(center[0]) - r, int(center[1]) - r
+        h, w = img.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + 2 * r + 1, w), min(y + 2 * r + 1, h)
+        if x0 >= x1 or y0 >= y1:
+            return img
+        np.copyto(img[y0:y1, x0:x1], self.image[y0 - y:y1 - y, x0 - x:x1 - x],
+                  where=self.where[y0 - y:y1 - y, x0 - x:x1 - x])
+        return img
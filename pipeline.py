@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from metrics import metrics
+
+# One captured frame travelling through the pipeline; result is filled in by the inference stage
+Packet = namedtuple("Packet", ["seq", "t", "frame", "result"])
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class LatestQueue:
+    # Bounded queue between two stages. When it is full the oldest item is dropped,
+    # so the consumer always gets the newest frame. With block=True the producer waits
+    # instead (used for file sources where every frame should be processed).
+    def __init__(self, maxsize=1):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item, block=False):
+        with self.cond:
+            if block:
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.cond.wait()
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def get(self):
+        # Returns None once the queue is closed and drained
+        with self.cond:
+            while not self.items and not self.closed:
+                self.cond.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class FrameSource:
+    # Base class for everything the capture stage can read from
+    live = False  # Live sources drop stale frames, file sources are processed losslessly
+    capture_scale = 1.0  # Requested capture resolution relative to the full one, see set_capture()
+
+    def __init__(self, size=None):
+        self.size = size  # (width, height) the frames are resized to, None keeps them as-is
+
+    def set_capture(self, scale):
+        # Capture at a fraction of the full resolution (frames are still resized to size).
+        # Only cameras can change it; they apply it on the capture thread.
+        self.capture_scale = scale
+
+    def read(self):
+        raise NotImplementedError
+
+    def timestamp(self):
+        # Time of the frame just read; recorded sources return the recorded time instead
+        return time.monotonic()
+
+    def release(self):
+        pass
+
+    def _fit(self, frame):
+        if self.size is not None and (frame.shape[1], frame.shape[0]) != tuple(self.size):
+            frame = cv2.resize(frame, tuple(self.size), interpolation=cv2.INTER_AREA)
+        return frame
+
+
+class WebcamSource(FrameSource):
+    live = True
+
+    def __init__(self, index=0, size=None):
+        super().__init__(size)
+        self.cap = cv2.VideoCapture(index)
+        if size is not None:
+            self.cap.set(3, size[0])
+            self.cap.set(4, size[1])
+        self.full_size = (int(self.cap.get(3)), int(self.cap.get(4)))
+        self.applied_scale = 1.0
+
+    def read(self):
+        if self.capture_scale != self.applied_scale:
+            self.applied_scale = self.capture_scale
+            self.cap.set(3, int(self.full_size[0] * self.applied_scale))
+            self.cap.set(4, int(self.full_size[1] * self.applied_scale))
+        success, frame = self.cap.read()
+        if not success:
+            return False, None
+        return True, self._fit(frame)
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, size=None, loop=False):
+        super().__init__(size)
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+
+    def read(self):
+        success, frame = self.cap.read()
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.cap.read()
+        if not success:
+            return False, None
+        return True, self._fit(frame)
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    def __init__(self, path, size=None, loop=False):
+        super().__init__(size)
+        self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+        self.loop = loop
+        self.index = 0
+
+    def read(self):
+        if self.index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self.index = 0
+        frame = cv2.imread(self.paths[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        return True, self._fit(frame)
+
+
+class SyntheticSource(FrameSource):
+    # Generates frames with a moving blob so the pipeline can run with no camera at all.
+    # frames=None runs forever, fps=None generates frames as fast as they are consumed.
+    def __init__(self, size=(1280, 720), frames=None, fps=None):
+        super().__init__(size)
+        width, height = size
+        self.frames = frames
+        self.interval = 1.0 / fps if fps else 0
+        self.count = 0
+        self.next_time = time.monotonic()
+        # Background is built once, each frame only copies it and draws the blob
+        ramp = np.linspace(40, 120, width, dtype=np.uint8)
+        self.background = np.dstack([np.tile(ramp, (height, 1))] * 3)
+
+    def read(self):
+        if self.frames is not None and self.count >= self.frames:
+            return False, None
+        if self.interval:
+            delay = self.next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time = max(self.next_time + self.interval, time.monotonic())
+        width, height = self.size
+        frame = self.background.copy()
+        angle = self.count * 0.05
+        center = (int(width / 2 + width / 3 * np.cos(angle)), int(height / 2 + height / 3 * np.sin(angle)))
+        cv2.circle(frame, center, 40, (180, 200, 230), cv2.FILLED)
+        self.count += 1
+        return True, frame
+
+
+def open_source(spec=0, width=None, height=None, loop=False):
+    # spec can be a camera index, a video file, a directory of images or "synthetic"
+    size = (width, height) if width and height else None
+    if isinstance(spec, int) or str(spec).isdigit():
+        return WebcamSource(int(spec), size)
+    if spec == "synthetic":
+        return SyntheticSource(size or (1280, 720))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, size, loop)
+    return VideoFileSource(spec, size, loop)
+
+
+class Pipeline:
+    # Capture -> inference -> render. Capture and inference run on their own threads and
+    # hand frames over through LatestQueues; the render stage is whoever iterates the pipeline
+    # (usually the main thread, since cv2.imshow wants to stay there).
+    # With release=False stop() leaves the source open so another pipeline can reuse it.
+    def __init__(self, source, infer=None, flip=True, queue_size=1, lossless=None, release=True):
+        self.source = source
+        self.release = release
+        self.infer = infer
+        self.flip = flip
+        self.lossless = (not source.live) if lossless is None else lossless
+        self.frames = LatestQueue(queue_size)
+        self.results = LatestQueue(queue_size)
+        self.running = False
+        self.error = None
+        self.threads = []
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.threads = [threading.Thread(target=self._capture, daemon=True),
+                        threading.Thread(target=self._inference, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def _capture(self):
+        seq = 0
+        try:
+            while self.running:
+                with metrics.stage("capture"):
+                    success, frame = self.source.read()
+                    if not success:
+                        break
+                    if self.flip:
+                        frame = cv2.flip(frame, 1)  # Mirror the frame
+                self.frames.put(Packet(seq, self.source.timestamp(), frame, None), block=self.lossless)
+                seq += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.frames.close()
+
+    def _inference(self):
+        try:
+            while True:
+                packet = self.frames.get()
+                if packet is None:
+                    break
+                with metrics.stage("inference"):
+                    result = self.infer(packet.frame, packet.t) if self.infer else None
+                self.results.put(packet._replace(result=result), block=self.lossless)
+        except Exception as e:
+            self.error = e
+            self.frames.close()
+        finally:
+            self.results.close()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            packet = self.results.get()
+            if packet is None:
+                break
+            yield packet
+        if self.error is not None:
+            raise self.error
+
+    @property
+    def dropped(self):
+        return self.frames.dropped + self.results.dropped
+
+    def stop(self):
+        self.running = False
+        self.frames.close()
+        self.results.close()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        if self.release:
+            self.source.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def run(mode, pipeline, hud=False, metrics_path=None, on_frame=None, recorder=None, governor=None):
+    # Render stage for a mode (AirCanvas, SlideShow, ...): step it on every packet, show the
+    # windows it returns and pass key presses on, until the mode is done or the input ends.
+    # 'h' toggles the timing HUD; metrics_path gets a JSON dump of the metrics on exit.
+    # on_frame(views) sees every frame's windows after they are shown (e.g. to stream them).
+    # recorder (a recorder.VideoRecorder) gets them too and is closed when the loop ends.
+    # governor (a governor.QualityGovernor) is updated once per frame; its level is on the HUD.
+    try:
+        for packet in pipeline:
+            with metrics.stage("step"):
+                views = mode.step(packet.frame, packet.result, packet.t)
+            if mode.done:
+                break
+            with metrics.stage("display"):
+                if hud and views:
+                    metrics.draw_hud(next(iter(views.values())))
+                    if governor is not None:
+                        governor.draw(next(iter(views.values())))
+                for name, view in views.items():
+                    cv2.imshow(name, view)
+                key = cv2.waitKey(1) & 0xFF
+            if on_frame is not None:
+                on_frame(views)
+            if recorder is not None:
+                recorder.on_frame(views)
+            # Capture to on-screen, including time spent waiting in the queues
+            metrics.record("latency", time.monotonic() - packet.t)
+            metrics.tick()
+            if governor is not None:
+                governor.update()
+            if key == ord('h'):
+                hud = not hud
+            elif key != 0xFF:
+                mode.handle_key(key)
+            if mode.done:
+                break
+    finally:
+        pipeline.stop()
+        mode.close()
+        cv2.destroyAllWindows()
+        if recorder is not None:
+            recorder.close()
+        if metrics_path:
+            metrics.dump(metrics_path)
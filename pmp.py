@@ -1,140 +1,168 @@
-from cvzone.HandTrackingModule import HandDetector
 import cv2
 import os
+import sys
 import numpy as np
+import landmarks
+from detector import HandTracker
+from pipeline import Pipeline, open_source, run
+from recorder import VideoRecorder
+from governor import QualityGovernor
+from overlay import Overlay, Line
+from slide_cache import SlideCache, list_slides
+from annotations import AnnotationStore
+from autosave import AutoSaver
+from gestures import GestureEngine, Pose
 
 # Parameters
 width, height = 1280, 720
 gestureThreshold = 300  # The threshold line for hand gesture (e.g., for navigating slides)
 folderPath = "Presentation"  # Folder where the presentation slides are stored
-
-# Camera Setup
-cap = cv2.VideoCapture(0)
-cap.set(3, width)
-cap.set(4, height)
-
-# Hand Detector (cvzone)
-detectorHand = HandDetector(detectionCon=0.8, maxHands=1)
-
-# Variables
-imgList = []
-delay = 30  # Delay for button press reset
-buttonPressed = False  # Flag for button press state
-counter = 0  # Counter for the delay
-drawMode = False  # If drawing mode is active
-imgNumber = 0  # Image number for current slide
-delayCounter = 0
-annotations = [[]]  # List of annotations (drawings) per slide
-annotationNumber = -1  # Index for the current annotation
-annotationStart = False  # Flag to start annotations
-hs, ws = int(120 * 1), int(213 * 1)  # width and height of small image for the slide preview
-
-# Get list of presentation images
-pathImages = sorted(os.listdir(folderPath), key=len)
-print(pathImages)
-
-while True:
-    # Get image frame
-    success, img = cap.read()
-    img = cv2.flip(img, 1)  # Flip the image to mirror for better user experience
-
-    # Load the current slide image
-    pathFullImage = os.path.join(folderPath, pathImages[imgNumber])
-    imgCurrent = cv2.imread(pathFullImage)
-
-    # Find the hand and its landmarks
-    hands, img = detectorHand.findHands(img)  # Detect hand landmarks
-
-    # Draw Gesture Threshold line (for hand gesture control)
-    cv2.line(img, (0, gestureThreshold), (width, gestureThreshold), (0, 255, 0), 10)
-
-    if hands and buttonPressed is False:  # If hand is detected and no button pressed
-        hand = hands[0]
-        cx, cy = hand["center"]  # Hand center coordinates
-        lmList = hand["lmList"]  # List of 21 Landmark points
-        fingers = detectorHand.fingersUp(hand)  # List indicating which fingers are up
-
-        # Constrain the values for easier drawing
-        xVal = int(np.interp(lmList[8][0], [width // 2, width], [0, width]))  # x coordinate of index finger
-        yVal = int(np.interp(lmList[8][1], [150, height - 150], [0, height]))  # y coordinate of index finger
-        indexFinger = xVal, yVal
-
-        # Terminate the program if all five fingers are up
-        if fingers == [1, 1, 1, 1, 1]:
-            print("Terminate Program")
-            break
-
-        if cy <= gestureThreshold:  # If hand is above the gesture threshold
-            # Detect gestures for left and right navigation
-            if fingers == [1, 0, 0, 0, 0]:  # Left gesture
+slideCacheBytes = 256 * 1024 * 1024  # Memory limit for decoded slides
+slideCachePath = ".slide_cache"  # Pre-scaled slides and thumbnails, reused until the image files change
+annotationsPath = "annotations_session"  # Where annotations are autosaved between runs
+buttonDelay = 1.0  # Seconds before the next slide change or undo (was 30 frames at ~30 fps)
+
+
+def gesture_rules():
+    # Fingers are thumb..pinky; navigation only counts with the hand above the threshold line.
+    # Slide changes and undo share one cooldown and repeat while the pose is held.
+    above = (0, 0, width, gestureThreshold)
+    button = dict(hold=0.05, repeat=buttonDelay, cooldown=buttonDelay, group="button")
+    return [
+        Pose("quit", (1, 1, 1, 1, 1), hold=0.3),  # Terminate the program if all five fingers are up
+        Pose("previous", (1, 0, 0, 0, 0), region=above, **button),
+        Pose("next", (0, 0, 0, 0, 1), region=above, **button),
+        Pose("undo", (0, 1, 1, 1, 0), **button),  # Remove the last annotation
+        Pose("pointer", (0, 1, 1, 0, 0)),  # Index and middle finger: show the pointer
+        Pose("draw", (0, 1, 0, 0, 0)),  # Only the index finger: annotate
+    ]
+
+
+def create_tracker():
+    # Hand Detector (mediapipe, same settings cvzone's HandDetector used)
+    import mediapipe as mp
+    detectorHand = dict(max_num_hands=1, min_detection_confidence=0.8, min_tracking_confidence=0.5)
+    return HandTracker(mp.solutions.hands.Hands, detectorHand, scale=0.5, roi=True)  # Half resolution, crop around the hand once found
+
+
+class SlideShow:
+    # Slide navigation and annotation with hand gestures
+    name = "slides"
+    size = (width, height)
+
+    def __init__(self, folder=folderPath, annotations_path=annotationsPath):
+        # Gesture threshold line, rendered once and blended into every frame
+        self.thresholdLine = Overlay([Line("threshold", (0, gestureThreshold), (width, gestureThreshold), (0, 255, 0),
+                                           10)], (width, height))
+
+        # Variables
+        self.gestures = GestureEngine(gesture_rules())  # Timed by frame timestamps, not frame counts
+        self.imgNumber = 0  # Image number for current slide
+        self.annotationsPath = annotations_path
+        self.annotations = AnnotationStore((width, height), color=(0, 0, 200), thickness=12)  # Annotations per slide
+        if annotations_path and os.path.exists(os.path.join(annotations_path, "meta.json")):
+            self.annotations.load(annotations_path)
+        self.saver = AutoSaver() if annotations_path else None  # Writes changed strokes in the background
+        self.savedVersion = self.annotations.version
+        self.annotationStart = False  # Flag to start annotations
+        self.hs, self.ws = int(120 * 1), int(213 * 1)  # width and height of small image for the slide preview
+        self.done = False
+
+        # Get list of presentation images (natural order: 2 comes before 10)
+        self.pathImages = list_slides(folder)
+        print(self.pathImages)
+
+        # Slides scaled to the window size, ingested in parallel into a disk cache on first use;
+        # neighbours of the current slide are preloaded
+        self.slides = SlideCache([os.path.join(folder, path) for path in self.pathImages], (width, height),
+                                 slideCacheBytes, cache_dir=slideCachePath, thumb_size=(self.ws, self.hs))
+
+    def step(self, img, detection, t):
+        annotations = self.annotations
+
+        # Get the current slide image (copied, since annotations are drawn onto it)
+        imgCurrent = self.slides.get(self.imgNumber).copy()
+
+        # Landmark array of the detected hand
+        lmPixels = landmarks.to_pixels(detection.points, width, height)
+        landmarks.draw(img, lmPixels)
+
+        # Draw Gesture Threshold line (for hand gesture control)
+        self.thresholdLine.blit(img)
+
+        # Gestures of the (single) hand that fired on this frame
+        hand = landmarks.Detection(detection.points[:1], detection.right[:1])
+        for event in self.gestures.update(hand, t, (width, height)):
+            if event.name == "quit":
+                print("Terminate Program")
+                self.done = True
+            elif event.name == "previous":
                 print("Left")
-                buttonPressed = True
-                if imgNumber > 0:
-                    imgNumber -= 1
-                    annotations = [[]]  # Clear annotations for new slide
-                    annotationNumber = -1
-                    annotationStart = False
-            if fingers == [0, 0, 0, 0, 1]:  # Right gesture
+                if self.imgNumber > 0:
+                    annotations[self.imgNumber].end_stroke()  # Annotations stay with the slide
+                    self.imgNumber -= 1
+                    self.annotationStart = False
+            elif event.name == "next":
                 print("Right")
-                buttonPressed = True
-                if imgNumber < len(pathImages) - 1:
-                    imgNumber += 1
-                    annotations = [[]]  # Clear annotations for new slide
-                    annotationNumber = -1
-                    annotationStart = False
-
-        # If index finger and middle finger are up, start drawing (annotation mode)
-        if fingers == [0, 1, 1, 0, 0]:
-            cv2.circle(imgCurrent, indexFinger, 12, (0, 0, 255), cv2.FILLED)  # Draw red circle
-
-        # If only the index finger is up, start or continue annotating
-        if fingers == [0, 1, 0, 0, 0]:
-            if annotationStart is False:
-                annotationStart = True
-                annotationNumber += 1
-                annotations.append([])  # Add a new list for annotations
-            annotations[annotationNumber].append(indexFinger)  # Add annotation to the current slide
+                if self.imgNumber < len(self.pathImages) - 1:
+                    annotations[self.imgNumber].end_stroke()  # Annotations stay with the slide
+                    self.imgNumber += 1
+                    self.annotationStart = False
+            elif event.name == "undo":
+                annotations[self.imgNumber].undo()  # Remove the last annotation
+
+        drawing = self.gestures.holding("draw")
+        if drawing or self.gestures.holding("pointer"):
+            # Constrain the values for easier drawing
+            lmList = lmPixels[0]  # 21 Landmark points
+            xVal = int(np.interp(lmList[8][0], [width // 2, width], [0, width]))  # x coordinate of index finger
+            yVal = int(np.interp(lmList[8][1], [150, height - 150], [0, height]))  # y coordinate of index finger
+            indexFinger = xVal, yVal
             cv2.circle(imgCurrent, indexFinger, 12, (0, 0, 255), cv2.FILLED)  # Draw red circle
-
-        else:
-            annotationStart = False  # Stop annotation when no longer drawing
-
-        # If the gesture is to remove the last annotation, pop the last one
-        if fingers == [0, 1, 1, 1, 0]:
-            if annotations:
-                annotations.pop(-1)  # Remove the last annotation
-                annotationNumber -= 1
-                buttonPressed = True
-
-    else:
-        annotationStart = False  # Reset annotation when no hand is detected
-
-    # Handle the button press timeout
-    if buttonPressed:
-        counter += 1
-        if counter > delay:
-            counter = 0
-            buttonPressed = False
-
-    # Draw annotations (if any)
-    for i, annotation in enumerate(annotations):
-        for j in range(1, len(annotation)):
-            cv2.line(imgCurrent, annotation[j - 1], annotation[j], (0, 0, 200), 12)
-
-    # Display the small preview of the current slide at the top right corner
-    imgSmall = cv2.resize(img, (ws, hs))
-    h, w, _ = imgCurrent.shape
-    imgCurrent[0:hs, w - ws: w] = imgSmall
-
-    # Show the current slide and hand gesture detection
-    cv2.imshow("Slides", imgCurrent)
-    cv2.imshow("Image", img)
-
-    # Wait for the user to press 'q' to quit
-    key = cv2.waitKey(1)
-    if key == ord('q'):
-        break
-
-# Release resources
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+            if drawing:
+                # Start or continue annotating the current slide
+                self.annotationStart = True
+                annotations[self.imgNumber].add_point(indexFinger)
+
+        if self.annotationStart and not drawing:
+            self.annotationStart = False  # Stop annotation when no longer drawing or no hand is detected
+            annotations[self.imgNumber].end_stroke()
+
+        # Draw annotations (cached layer of the current slide)
+        annotations[self.imgNumber].draw(imgCurrent)
+
+        # Hand finished strokes to the autosave thread
+        if self.saver is not None and annotations.version != self.savedVersion:
+            self.savedVersion = annotations.version
+            self.saver.submit(self.annotationsPath, annotations.save, self.annotationsPath, annotations.snapshot())
+
+        # Display the small preview of the current slide at the top right corner
+        imgSmall = cv2.resize(img, (self.ws, self.hs))
+        h, w, _ = imgCurrent.shape
+        imgCurrent[0:self.hs, w - self.ws: w] = imgSmall
+
+        # Thumbnail of the next slide at the bottom right corner
+        if self.imgNumber < len(self.pathImages) - 1:
+            imgCurrent[h - self.hs:h, w - self.ws:w] = self.slides.thumbnail(self.imgNumber + 1)
+
+        # Show the current slide and hand gesture detection
+        return {"Slides": imgCurrent, "Image": img}
+
+    def handle_key(self, key):
+        # 'q' quits
+        if key == ord('q'):
+            self.done = True
+
+    def close(self):
+        self.slides.close()
+        if self.saver is not None:
+            self.saver.close()  # Pending background writes go first
+            self.annotations.save(self.annotationsPath)
+
+
+if __name__ == "__main__":
+    # Camera Setup (hand detection runs on the pipeline's inference thread)
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0, width, height)
+    pipeline = Pipeline(source, create_tracker())
+    run(SlideShow(), pipeline, metrics_path=os.environ.get("AIR_CANVAS_METRICS"), recorder=VideoRecorder.from_env(),
+        governor=QualityGovernor.from_env(pipeline))
@@ -1,131 +1,127 @@
-import mediapipe as mp
-import cv2
-import pyautogui
-import time
-import math
-
-# Initialize MediaPipe Hands
-mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
-
-# Initialize OpenCV
-cap = cv2.VideoCapture(0)
-
-# Get screen size for mouse movements
-screen_width, screen_height = pyautogui.size()
-
-# Variables to hold previous finger positions for gesture detection
-prev_x, prev_y = 0, 0
+import os
+import sys
+import landmarks
+from detector import HandTracker
+from smoothing import DecimatedTracker
+from pipeline import Pipeline, open_source, run
+from recorder import VideoRecorder
+from governor import QualityGovernor
+from overlay import Stamp
+from input_dispatch import InputDispatcher
+from gestures import GestureEngine, Offset, Pinch, Pose, Swipe
 
 # Thresholds for swipe, scroll, click detection
 SWIPE_THRESHOLD = 50  # Pixel threshold to consider as a swipe
+SWIPE_SPEED = 1000  # Pixels per second the index finger has to move at for a swipe
 SCROLL_THRESHOLD = 30  # Pixel threshold to consider as a scroll
+SCROLL_INTERVAL = 0.05  # Seconds between scroll steps while the scroll gesture is held
 CLICK_THRESHOLD = 15  # Pixel threshold for click detection
 JOIN_THRESHOLD = 25  # Distance threshold to consider thumb and index joined
 
-# Function to calculate distance between two points
-def calculate_distance(x1, y1, x2, y2):
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-
-# Function to count raised fingers based on landmarks
-def count_raised_fingers(hand_landmarks):
-    raised_fingers = 0
-    # Check fingers raised based on the landmark positions (the tip's y-coordinate should be above the joint's y-coordinate)
-    # Index(8), Middle(12), Ring(16), Pinky(20)
-    for i in [8, 12, 16, 20]:
-        if hand_landmarks.landmark[i].y < hand_landmarks.landmark[i - 2].y:  # Check if tip is above the joint
-            raised_fingers += 1
-    # Check thumb separately (requires horizontal check)
-    if hand_landmarks.landmark[4].x > hand_landmarks.landmark[3].x:  # Right-handed thumb
-        raised_fingers += 1
-    return raised_fingers
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # Flip the image horizontally for better interaction
-    frame = cv2.flip(frame, 1)
-
-    # Convert the image to RGB (required by MediaPipe)
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    # Process the frame and get hand landmarks
-    result = hands.process(rgb_frame)
-
-    # Initialize the total fingers raised count
-    total_fingers = 0
-
-    if result.multi_hand_landmarks:
-        # Iterate through each detected hand
-        for hand_landmarks in result.multi_hand_landmarks:
-            raised_fingers = count_raised_fingers(hand_landmarks)
-            total_fingers += raised_fingers
+# Swipe gesture -> arrow key
+SWIPES = {"swipe left": "left", "swipe right": "right", "swipe up": "up", "swipe down": "down"}
 
-            # Draw landmarks and track the hand
-            mp.solutions.drawing_utils.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
 
-            # Focus on the index finger, middle finger, and thumb
-            index_x, index_y = int(hand_landmarks.landmark[8].x * frame.shape[1]), int(hand_landmarks.landmark[8].y * frame.shape[0])
-            middle_x, middle_y = int(hand_landmarks.landmark[12].x * frame.shape[1]), int(hand_landmarks.landmark[12].y * frame.shape[0])
-            thumb_x, thumb_y = int(hand_landmarks.landmark[4].x * frame.shape[1]), int(hand_landmarks.landmark[4].y * frame.shape[0])
+def gesture_rules():
+    return [
+        # Five fingers on both hands (eight or more up in total) ends the program
+        Pose("quit", count=(8, 10), rule="up-unhanded", scope="frame"),
+        # Scrolling follows the middle finger tip below or above the index finger tip
+        Offset("scroll down", landmarks.INDEX_TIP, landmarks.MIDDLE_TIP, SCROLL_THRESHOLD, repeat=SCROLL_INTERVAL),
+        Offset("scroll up", landmarks.INDEX_TIP, landmarks.MIDDLE_TIP, -SCROLL_THRESHOLD, repeat=SCROLL_INTERVAL),
+        # Index and thumb joining clicks once per pinch
+        Pinch("click", landmarks.THUMB_TIP, landmarks.INDEX_TIP, JOIN_THRESHOLD),
+    ] + [Swipe(name, key, SWIPE_THRESHOLD, SWIPE_SPEED) for name, key in SWIPES.items()]
 
-            # Draw circles on relevant landmarks
-            cv2.circle(frame, (index_x, index_y), 5, (0, 255, 0), -1)  # Index finger tip
-            cv2.circle(frame, (middle_x, middle_y), 5, (0, 0, 255), -1)  # Middle finger tip
-            cv2.circle(frame, (thumb_x, thumb_y), 5, (255, 0, 0), -1)  # Thumb tip
 
-            # Calculate the distance between the index and middle fingers
-            distance = calculate_distance(index_x, index_y, middle_x, middle_y)
+def create_tracker():
+    # Initialize MediaPipe Hands
+    import mediapipe as mp
+    hands = dict(min_detection_confidence=0.7, min_tracking_confidence=0.7)
+    # Track the hands on a crop once found, detect only as often as 30 fps allows and smooth the
+    # landmarks (predicted in between detections) so the cursor moves steadily at camera rate
+    return DecimatedTracker(HandTracker(mp.solutions.hands.Hands, hands, roi=True), adaptive=True, target_fps=30)
+
+
+class SystemControl:
+    # Mouse cursor, clicks, scrolling and arrow-key swipes driven by the index finger
+    name = "system"
+    size = None
+
+    def __init__(self, dispatcher=None):
+        # OS mouse/keyboard events are sent from a worker thread; clicks are debounced for 0.2 s
+        # and each swipe key repeats at most every 0.3 s
+        self.dispatcher = dispatcher or InputDispatcher(scroll_interval=0.05, key_interval=0.3, click_interval=0.2)
 
-            # Detect scrolling based on the movement of the index and middle fingers
-            if abs(middle_y - index_y) > SCROLL_THRESHOLD:
-                if middle_y > index_y:
-                    pyautogui.scroll(-20)  # Scroll down
-                elif middle_y < index_y:
-                    pyautogui.scroll(0)  # Scroll up
+        # Get screen size for mouse movements
+        self.screen_width, self.screen_height = self.dispatcher.size()
 
-            # Detect click gesture (index and thumb join)
-            if calculate_distance(index_x, index_y, thumb_x, thumb_y) < JOIN_THRESHOLD:
-                pyautogui.click()
-                time.sleep(0.2)  # To avoid multiple clicks
+        # Pre-rendered fingertip markers
+        self.index_marker = Stamp(5, (0, 255, 0))
+        self.middle_marker = Stamp(5, (0, 0, 255))
+        self.thumb_marker = Stamp(5, (255, 0, 0))
+
+        # Swipes are measured by finger speed over time, not by the distance between two frames
+        self.gestures = GestureEngine(gesture_rules())
+        self.done = False
+
+    def step(self, frame, result, t):
+        dispatcher = self.dispatcher
+
+        # Pixel and screen positions for all hands at once
+        pixels = landmarks.to_pixels(result.points, frame.shape[1], frame.shape[0])
+        screen_points = landmarks.to_pixels(result.points[:, landmarks.INDEX_TIP], self.screen_width,
+                                            self.screen_height)
+
+        # Draw landmarks of every hand
+        landmarks.draw(frame, pixels)
+
+        # Iterate through each detected hand
+        for hand in range(result.count):
+            # Focus on the index finger, middle finger, and thumb
+            index_x, index_y = pixels[hand, landmarks.INDEX_TIP].tolist()
+            middle_x, middle_y = pixels[hand, landmarks.MIDDLE_TIP].tolist()
+            thumb_x, thumb_y = pixels[hand, landmarks.THUMB_TIP].tolist()
+
+            # Draw circles on relevant landmarks
+            self.index_marker.draw(frame, (index_x, index_y))  # Index finger tip
+            self.middle_marker.draw(frame, (middle_x, middle_y))  # Middle finger tip
+            self.thumb_marker.draw(frame, (thumb_x, thumb_y))  # Thumb tip
 
             # Map the index finger's position to the screen's coordinates
-            screen_x = int(screen_width * hand_landmarks.landmark[8].x)
-            screen_y = int(screen_height * hand_landmarks.landmark[8].y)
+            screen_x, screen_y = screen_points[hand].tolist()
 
             # Move the mouse cursor with the index finger
-            pyautogui.moveTo(screen_x, screen_y)
-
-            # Detect swipe gesture (horizontal movement of the index finger)
-            if abs(index_x - prev_x) > SWIPE_THRESHOLD:
-                if index_x > prev_x:
-                    pyautogui.press("right")  # Swipe right (right arrow key)
-                else:
-                    pyautogui.press("left")  # Swipe left (left arrow key)
-
-            # Detect swipe gesture (vertical movement of the index finger)
-            if abs(index_y - prev_y) > SWIPE_THRESHOLD:
-                if index_y > prev_y:
-                    pyautogui.press("down")  # Swipe down (down arrow key)
-                else:
-                    pyautogui.press("up")  # Swipe up (up arrow key)
-
-            prev_x, prev_y = index_x, index_y
-
-    # Check if five fingers are detected
-    if total_fingers >= 8:
-        print("Five fingers detected. Terminating program.")
-        break
-
-    # Show the resulting frame
-    cv2.imshow("Hand Gesture Control", frame)
-
-    # Exit the program when the 'q' key is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# Release resources
-cap.release()
-cv2.destroyAllWindows()
+            dispatcher.move_to(screen_x, screen_y, now=t)
+
+        # Gestures of every hand that fired on this frame
+        for event in self.gestures.update(result, t, (frame.shape[1], frame.shape[0])):
+            if event.name == "quit":
+                print("Five fingers detected. Terminating program.")
+                self.done = True
+            elif event.name == "scroll down":
+                dispatcher.scroll(-20, now=t)
+            elif event.name == "scroll up":
+                dispatcher.scroll(20, now=t)
+            elif event.name == "click":
+                dispatcher.click(now=t)
+            else:
+                dispatcher.press(SWIPES[event.name], now=t)  # Arrow key of the swipe
+
+        return {"Hand Gesture Control": frame}
+
+    def handle_key(self, key):
+        # Exit the program when the 'q' key is pressed
+        if key == ord('q'):
+            self.done = True
+
+    def close(self):
+        self.dispatcher.close()
+
+
+if __name__ == "__main__":
+    # Initialize the frame source (webcam by default) and the capture/inference pipeline
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0)
+    pipeline = Pipeline(source, create_tracker())
+    run(SystemControl(), pipeline, metrics_path=os.environ.get("AIR_CANVAS_METRICS"), recorder=VideoRecorder.from_env(),
+        governor=QualityGovernor.from_env(pipeline))
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+import modes
+from metrics import metrics
+from pipeline import LatestQueue, Pipeline, open_source
+from replay import Recording, ReplayDetector, ReplaySource
+
+# What write() does when the encoder has fallen queue_size frames behind:
+#   oldest  drop the oldest queued frame (live sessions, the video keeps up with the present)
+#   newest  drop the incoming frame (the video stays continuous up to the stall)
+#   block   wait for the encoder (offline rendering, no frame is lost)
+DROP_POLICIES = ("oldest", "newest", "block")
+
+
+class VideoRecorder:
+    # Encodes frames on its own thread so cv2.VideoWriter never stalls the render loop.
+    # Frames are copied into a bounded queue; the writer is opened with the first frame's
+    # size unless size is given, and frames of another size are scaled to it.
+    def __init__(self, path, fps=30.0, size=None, codec="mp4v", queue_size=32, drop="oldest", view=None):
+        if drop not in DROP_POLICIES:
+            raise ValueError("drop must be one of %s" % ", ".join(DROP_POLICIES))
+        self.path = path
+        self.fps = fps
+        self.size = size  # (width, height)
+        self.codec = codec
+        self.drop = drop
+        self.view = view  # Window to record, None for the mode's first (main) window
+        self.queue = LatestQueue(queue_size)
+        self.rejected = 0
+        self.frames = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_env(cls, var="AIR_CANVAS_RECORD"):
+        # Recorder for the file named in the environment variable, None if it isn't set
+        path = os.environ.get(var)
+        return cls(path) if path else None
+
+    @property
+    def dropped(self):
+        return self.rejected + self.queue.dropped
+
+    def write(self, frame):
+        if self.drop == "newest" and len(self.queue.items) >= self.queue.maxsize:
+            self.rejected += 1
+            return False
+        self.queue.put(frame.copy(), block=self.drop == "block")
+        return True
+
+    def on_frame(self, views):
+        # Takes a mode's windows, as returned by step()
+        view = views.get(self.view) if self.view else next(iter(views.values()), None)
+        if view is not None:
+            self.write(view)
+
+    def _work(self):
+        writer = None
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                with metrics.stage("record"):
+                    if writer is None:
+                        size = tuple(self.size or (frame.shape[1], frame.shape[0]))
+                        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec), self.fps, size)
+                        if not writer.isOpened():
+                            raise IOError("Can't open %s for writing with codec %s" % (self.path, self.codec))
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    writer.write(frame)
+                self.frames += 1
+        except Exception as e:
+            self.error = e
+            print("Recording failed:", e)
+            self.queue.close()
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def close(self):
+        # Encodes what is still queued, then closes the file
+        self.queue.close()
+        self.thread.join()
+
+
+def render(mode, source, infer, recorder, flip=True):
+    # Runs a mode over a file source or recording without windows, as fast as it can go,
+    # and records its output
+    pipeline = Pipeline(source, infer, flip=flip, lossless=True)
+    start = time.perf_counter()
+    frames = 0
+    try:
+        for packet in pipeline:
+            recorder.on_frame(mode.step(packet.frame, packet.result, packet.t))
+            frames += 1
+            if mode.done:
+                break
+    finally:
+        pipeline.stop()
+        mode.close()
+        recorder.close()
+    seconds = time.perf_counter() - start
+    return {"frames": frames, "seconds": seconds, "fps": frames / seconds if seconds else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a mode's output over a video, image folder or "
+                                                 "landmark recording to a video file, without windows")
+    parser.add_argument("mode", choices=sorted(modes.MODES))
+    parser.add_argument("input", help="video file, image folder or recording made with replay.py")
+    parser.add_argument("output")
+    parser.add_argument("--view", help="window to record (default: the mode's main window)")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--size", help="output size as WIDTHxHEIGHT (default: the window size)")
+    parser.add_argument("--codec", default="mp4v", help="fourcc, e.g. mp4v, XVID, MJPG")
+    parser.add_argument("--no-flip", action="store_true", help="don't mirror the input frames")
+    args = parser.parse_args(argv)
+
+    mode = modes.create(args.mode, headless=True)
+    frame_size = mode.size or (640, 480)
+    size = tuple(int(v) for v in args.size.lower().split("x")) if args.size else None
+    recorder = VideoRecorder(args.output, args.fps, size, args.codec, drop="block", view=args.view)
+    if os.path.exists(os.path.join(args.input, "meta.json")):
+        # Recorded frames are already mirrored and come with their landmarks
+        recording = Recording(args.input, frame_size)
+        stats = render(mode, ReplaySource(recording), ReplayDetector(recording), recorder, flip=False)
+    else:
+        _, create_tracker = modes.load(args.mode)
+        stats = render(mode, open_source(args.input, *frame_size), create_tracker(), recorder, not args.no_flip)
+    if recorder.error is not None:
+        return 1
+    print("%s: %d frames in %.2f s (%.1f fps)" % (args.output, stats["frames"], stats["seconds"], stats["fps"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import landmarks
+import modes
+from input_dispatch import RecordingBackend
+from pipeline import FrameSource, Pipeline, open_source
+
+FORMAT_VERSION = 1
+
+
+def record_dtype(max_hands):
+    # One fixed-size record per frame, so a recording can be memory-mapped as an array
+    return np.dtype([
+        ("t", "<f8"),
+        ("count", "<i4"),
+        ("points", "<f4", (max_hands, 21, 3)),
+        ("right", "?", (max_hands,)),
+    ])
+
+
+class LandmarkRecorder:
+    # Writes per-frame landmark records (and optionally raw BGR frames) to a directory:
+    #   landmarks.bin  fixed-size records, written in chunks
+    #   frames.bin     raw frames of frame_size, only when frames are recorded
+    #   meta.json      record count and layout, written on close
+    def __init__(self, path, max_hands=2, frame_size=None, chunk=256):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_hands = max_hands
+        self.frame_size = frame_size  # (width, height) or None to record landmarks only
+        self.dtype = record_dtype(max_hands)
+        self.buffer = np.zeros(chunk, self.dtype)
+        self.pending = 0
+        self.count = 0
+        self.landmarks_file = open(os.path.join(path, "landmarks.bin"), "wb")
+        self.frames_file = open(os.path.join(path, "frames.bin"), "wb") if frame_size else None
+
+    def write(self, t, detection, frame=None):
+        i, buffer = self.pending, self.buffer
+        n = min(detection.count, self.max_hands)
+        buffer["t"][i] = t
+        buffer["count"][i] = n
+        buffer["points"][i] = 0
+        buffer["points"][i, :n] = detection.points[:n]
+        buffer["right"][i] = False
+        buffer["right"][i, :n] = detection.right[:n]
+        if self.frames_file is not None:
+            if (frame.shape[1], frame.shape[0]) != tuple(self.frame_size):
+                frame = cv2.resize(frame, tuple(self.frame_size), interpolation=cv2.INTER_AREA)
+            self.frames_file.write(np.ascontiguousarray(frame).tobytes())
+        self.pending += 1
+        self.count += 1
+        if self.pending == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.pending].tofile(self.landmarks_file)
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.landmarks_file.close()
+        if self.frames_file is not None:
+            self.frames_file.close()
+        meta = {"version": FORMAT_VERSION, "count": self.count, "max_hands": self.max_hands,
+                "frame_size": list(self.frame_size) if self.frame_size else None}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+
+class Recording:
+    # Memory-mapped view of a recording directory; nothing is read until it is accessed.
+    # Frames are handed out at frame_size whatever size they were stored at (landmarks are
+    # normalized, so they still line up).
+    def __init__(self, path, frame_size=(1280, 720)):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        count = self.meta["count"]
+        dtype = record_dtype(self.meta["max_hands"])
+        if count:
+            self.records = np.memmap(os.path.join(path, "landmarks.bin"), dtype, mode="r", shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype)
+        self.frames = None
+        self.stored_size = None
+        if self.meta["frame_size"] and count:
+            width, height = self.meta["frame_size"]
+            self.frames = np.memmap(os.path.join(path, "frames.bin"), np.uint8, mode="r",
+                                    shape=(count, height, width, 3))
+            self.stored_size = (width, height)
+        self.frame_size = tuple(frame_size)
+        self.blank = np.zeros((frame_size[1], frame_size[0], 3), np.uint8)  # Used when no frames were recorded
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def times(self):
+        return self.records["t"]
+
+    def detection(self, i):
+        n = int(self.records["count"][i])
+        return landmarks.Detection(np.array(self.records["points"][i, :n]), np.array(self.records["right"][i, :n]))
+
+    def frame(self, i):
+        # Writable copy, modes draw on the frames they get
+        if self.frames is None:
+            return self.blank.copy()
+        if self.stored_size != self.frame_size:
+            return cv2.resize(self.frames[i], self.frame_size, interpolation=cv2.INTER_AREA)
+        return np.array(self.frames[i])
+
+
+class ReplaySource(FrameSource):
+    # Frames of a recording with their recorded timestamps
+    def __init__(self, recording):
+        super().__init__(recording.frame_size)
+        self.recording = recording
+        self.index = 0
+
+    def read(self):
+        if self.index >= len(self.recording):
+            return False, None
+        frame = self.recording.frame(self.index)
+        self.index += 1
+        return True, frame
+
+    def timestamp(self):
+        return float(self.recording.times[self.index - 1])
+
+
+class ReplayDetector:
+    # Inference callable returning the recorded landmarks in order, no mediapipe involved
+    def __init__(self, recording):
+        self.recording = recording
+        self.index = 0
+
+    def __call__(self, frame, t):
+        detection = self.recording.detection(self.index)
+        self.index += 1
+        return detection
+
+
+def replay(recording, mode, on_frame=None):
+    # Deterministic headless replay: feeds every record through the mode on this thread as
+    # fast as it can go. on_frame(i, views) sees each frame's output.
+    start = time.perf_counter()
+    frames = 0
+    for i in range(len(recording)):
+        views = mode.step(recording.frame(i), recording.detection(i), float(recording.times[i]))
+        frames += 1
+        if on_frame is not None:
+            on_frame(i, views)
+        if mode.done:
+            break
+    seconds = time.perf_counter() - start
+    return {"frames": frames, "seconds": seconds, "fps": frames / seconds if seconds else 0.0}
+
+
+def outcome(mode):
+    # What a replay left behind, to compare runs of the same recording: the OS input a
+    # headless mode sent (with the recorded timestamps) and the strokes it kept
+    result = {}
+    backend = getattr(getattr(mode, "dispatcher", None), "backend", None)
+    if isinstance(backend, RecordingBackend):
+        result["events"] = [[t, name, list(args)] for t, name, args in backend.calls]
+    if hasattr(mode, "strokes"):
+        result["strokes"] = len(mode.strokes.strokes)
+    if hasattr(mode, "annotations"):
+        result["slide"] = mode.imgNumber
+        result["annotations"] = {str(i): len(slide.strokes) for i, slide in sorted(mode.annotations.slides.items())
+                                 if slide.strokes}
+    # Round trip through JSON so results compare equal to ones read back from a file
+    return json.loads(json.dumps(result, default=lambda value: value.item()))
+
+
+def record(path, source, tracker, max_hands=2, frame_size=None, frames=None):
+    # Runs the detector over a source and stores its output; stops after frames records or
+    # when the source ends (Ctrl+C also stops cleanly)
+    recorder = LandmarkRecorder(path, max_hands, frame_size)
+    pipeline = Pipeline(source, tracker)
+    try:
+        for packet in pipeline:
+            recorder.write(packet.t, packet.result, packet.frame)
+            if frames is not None and recorder.count >= frames:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        recorder.close()
+    return recorder.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record landmark streams and replay them headless")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="record landmarks from a camera, video or image folder")
+    rec.add_argument("path")
+    rec.add_argument("--source", default="0")
+    rec.add_argument("--mode", default="canvas", choices=sorted(modes.MODES), help="detector settings to use")
+    rec.add_argument("--frames", type=int, default=None, help="stop after this many frames")
+    rec.add_argument("--with-frames", action="store_true", help="also store the camera frames")
+    play = commands.add_parser("play", help="replay recordings through a mode")
+    play.add_argument("mode", choices=sorted(modes.MODES))
+    play.add_argument("paths", nargs="+")
+    play.add_argument("--show", action="store_true", help="show the mode's windows while replaying")
+    play.add_argument("--out", help="write each replay's input events and strokes to DIR/<recording>.json")
+    play.add_argument("--check", metavar="DIR", help="compare each replay with the results --out wrote to DIR, "
+                                                     "exit with 1 if any differ")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        cls, create_tracker = modes.load(args.mode)
+        size = cls.size or (640, 480)
+        source = open_source(args.source, *size)
+        tracker = create_tracker()
+        # Records hold as many hands as the mode's detector finds (4 for the canvas)
+        count = record(args.path, source, tracker, tracker.max_hands, frame_size=size if args.with_frames else None,
+                       frames=args.frames)
+        print("Recorded", count, "frames to", args.path)
+        return 0
+
+    def show(i, views):
+        for name, view in views.items():
+            cv2.imshow(name, view)
+        cv2.waitKey(1)
+
+    status = 0
+    for path in args.paths:
+        mode = modes.create(args.mode, headless=True)
+        try:
+            stats = replay(Recording(path, mode.size or (640, 480)), mode, show if args.show else None)
+        finally:
+            mode.close()
+        print("%s: %d frames in %.2f s (%.1f fps)" % (path, stats["frames"], stats["seconds"], stats["fps"]))
+        result = dict(outcome(mode), mode=args.mode, frames=stats["frames"])
+        name = os.path.basename(os.path.normpath(path)) + ".json"
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            with open(os.path.join(args.out, name), "w") as f:
+                json.dump(result, f, indent=1)
+        if args.check:
+            with open(os.path.join(args.check, name)) as f:
+                expected = json.load(f)
+            for key in sorted(set(expected) | set(result)):
+                if expected.get(key) != result.get(key):
+                    print("  %s differs: expected %s, got %s" % (key, expected.get(key), result.get(key)))
+                    status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
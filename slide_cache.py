@@ -0,0 +1,202 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from pipeline import IMAGE_EXTENSIONS
+
+
+def fit_image(img, size):
+    # Scale img to fit inside size (width, height) keeping its aspect ratio, centred on black
+    width, height = size
+    h, w = img.shape[:2]
+    if (w, h) == (width, height):
+        return img
+    scale = min(width / w, height / h)
+    nw, nh = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    resized = cv2.resize(img, (nw, nh), interpolation=interpolation)
+    out = np.zeros((height, width, 3), np.uint8)
+    x, y = (width - nw) // 2, (height - nh) // 2
+    out[y:y + nh, x:x + nw] = resized
+    return out
+
+
+def natural_key(name):
+    # "slide2" sorts before "slide10"
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+def list_slides(folder):
+    # Image files of a deck in natural order
+    return sorted((name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS)), key=natural_key)
+
+
+def cache_key(path, size, thumb_size):
+    # Changes whenever the file (path, mtime, length) or the output sizes change
+    stat = os.stat(path)
+    text = "%s|%d|%d|%s|%s" % (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, tuple(size), tuple(thumb_size))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _save(path, img):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, img)
+    os.replace(tmp_path, path)
+
+
+def ingest_slide(path, size, thumb_size, slide_file, thumb_file):
+    # Runs in a worker process: decode once, write the display-size slide and its thumbnail
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError("Could not read slide " + path)
+    slide = fit_image(img, size)
+    _save(thumb_file, fit_image(slide, thumb_size))
+    _save(slide_file, slide)
+    return slide_file
+
+
+class SlideCache:
+    # Decodes every slide once, pre-scaled to the display size, and keeps the most recently
+    # used ones in memory up to max_bytes. Whenever a slide is shown its neighbours are
+    # decoded on a background thread so changing slides doesn't stall on disk and decode.
+    # Returned images are shared: copy them before drawing on them.
+    # With cache_dir, slides and thumbnails are ingested into an on-disk cache of raw arrays
+    # keyed by file path, mtime and length: slides not cached yet are decoded and scaled in
+    # a process pool (in deck order) while the deck is already in use, and later runs only
+    # load the arrays. The cache holds one deck: entries of edited or removed slides (and of
+    # any other deck) are deleted when it is opened.
+    def __init__(self, paths, size, max_bytes=256 * 1024 * 1024, prefetch=1, cache_dir=None, thumb_size=(213, 120),
+                 workers=None):
+        self.paths = list(paths)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.prefetch = prefetch  # How many slides on each side of the current one to preload
+        self.thumb_size = thumb_size
+        self.thumbs = {}
+        self.files = None  # (slide file, thumbnail file) per slide when the disk cache is used
+        self.pending = {}  # Slide index -> ingestion future
+        self.pool = None
+        if cache_dir is not None:
+            self._ingest(cache_dir, workers)
+        self.slides = OrderedDict()
+        self.nbytes = 0
+        self.loading = set()
+        self.cond = threading.Condition()
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _ingest(self, cache_dir, workers):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.files = []
+        for path in self.paths:
+            key = cache_key(path, self.size, self.thumb_size)
+            files = (os.path.join(cache_dir, key + ".npy"), os.path.join(cache_dir, key + ".thumb.npy"))
+            self.files.append(files)
+        self._prune(cache_dir)
+        for i, (path, files) in enumerate(zip(self.paths, self.files)):
+            if not os.path.exists(files[0]):
+                if self.pool is None:
+                    # spawn, not fork: the caller usually has capture threads running
+                    context = multiprocessing.get_context("spawn")
+                    self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                self.pending[i] = self.pool.submit(ingest_slide, path, self.size, self.thumb_size, *files)
+
+    def _prune(self, cache_dir):
+        # Delete cache files (including partly written ones) whose key isn't in self.files
+        keep = {os.path.basename(name) for files in self.files for name in files}
+        for name in os.listdir(cache_dir):
+            if name not in keep and re.fullmatch(r"[0-9a-f]{40}(\.thumb)?\.npy(\.tmp\.npy)?", name):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except OSError:
+                    pass
+
+    def decode(self, i):
+        if self.files is None:
+            img = cv2.imread(self.paths[i])
+            if img is None:
+                raise IOError("Could not read slide " + self.paths[i])
+            return fit_image(img, self.size)
+        future = self.pending.get(i)
+        if future is not None:
+            future.result()  # Waits for the worker, raises its error
+        return np.load(self.files[i][0])
+
+    def thumbnail(self, i):
+        # Small preview of slide i (thumb_size), kept in memory once loaded
+        thumb = self.thumbs.get(i)
+        if thumb is None:
+            if self.files is None:
+                thumb = fit_image(self.get(i), self.thumb_size)
+            else:
+                future = self.pending.get(i)
+                if future is not None:
+                    future.result()
+                thumb = np.load(self.files[i][1])
+            self.thumbs[i] = thumb
+        return thumb
+
+    def get(self, i):
+        with self.cond:
+            while i in self.loading:  # Already being decoded by the prefetcher
+                self.cond.wait()
+            img = self.slides.get(i)
+            if img is not None:
+                self.slides.move_to_end(i)
+            else:
+                self.loading.add(i)
+        if img is None:
+            try:
+                img = self.decode(i)
+            finally:
+                self._store(i, img)
+        for j in range(i - self.prefetch, i + self.prefetch + 1):
+            if j != i and 0 <= j < len(self.paths):
+                self.requests.put(j)
+        return img
+
+    def _store(self, i, img):
+        with self.cond:
+            self.loading.discard(i)
+            if img is not None and i not in self.slides:
+                self.slides[i] = img
+                self.nbytes += img.nbytes
+                # Evict least recently used slides, but always keep the one just stored
+                while self.nbytes > self.max_bytes and len(self.slides) > 1:
+                    _, old = self.slides.popitem(last=False)
+                    self.nbytes -= old.nbytes
+            self.cond.notify_all()
+
+    def _work(self):
+        while True:
+            i = self.requests.get()
+            if i is None:
+                break
+            with self.cond:
+                if i in self.slides or i in self.loading:
+                    continue
+                self.loading.add(i)
+            img = None
+            try:
+                img = self.decode(i)
+            except Exception as e:
+                print("Slide prefetch failed:", e)
+            finally:
+                self._store(i, img)
+
+    def close(self):
+        self.requests.put(None)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,102 @@
+import math
+import time
+
+import numpy as np
+
+import landmarks
+
+
+def _alpha(dt, cutoff):
+    # Works for scalar and array cutoffs
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    # One Euro filter over whole landmark arrays: strong smoothing when the hand is still,
+    # little lag when it moves fast. The defaults are tuned for normalized (0..1) coordinates.
+    def __init__(self, min_cutoff=1.5, beta=10.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = None
+        self.t = None
+
+    def __call__(self, x, t):
+        if self.x is None or x.shape != self.x.shape:
+            self.x, self.dx, self.t = x.copy(), np.zeros_like(x), t
+            return x
+        dt = max(t - self.t, 1e-3)
+        a_d = _alpha(dt, self.d_cutoff)
+        self.dx = a_d * (x - self.x) / dt + (1 - a_d) * self.dx
+        a = _alpha(dt, self.min_cutoff + self.beta * np.abs(self.dx))
+        self.x = (a * x + (1 - a) * self.x).astype(x.dtype)
+        self.t = t
+        return self.x
+
+    def predict(self, t):
+        # Constant-velocity extrapolation from the last filtered state
+        return (self.x + self.dx * (t - self.t)).astype(self.x.dtype)
+
+
+class DecimatedTracker:
+    # Runs the wrapped detector only every Nth frame and fills the frames in between with
+    # landmarks predicted by a One Euro filter, which also smooths the detected ones.
+    # With adaptive=True N follows the measured detector time against the target frame
+    # rate, between 1 and max_every.
+    def __init__(self, detector, every=1, adaptive=False, target_fps=30, max_every=4, smoother=None):
+        self.detector = detector
+        self.every = every
+        self.adaptive = adaptive
+        self.target_fps = target_fps
+        self.max_every = max_every
+        self.smoother = smoother or OneEuroFilter()
+        self.right = None  # Handedness of the last detection, None when no hand is tracked
+        self.skipped = 0
+        self.detect_time = None  # Moving average used by the adaptive rate
+
+    @property
+    def max_hands(self):
+        return getattr(self.detector, "max_hands", 2)
+
+    def reset(self):
+        self.smoother.reset()
+        self.right = None
+        self.skipped = 0
+        if hasattr(self.detector, "reset"):
+            self.detector.reset()
+
+    def configure(self, **settings):
+        # Quality settings go to the wrapped detector
+        if hasattr(self.detector, "configure"):
+            self.detector.configure(**settings)
+
+    def __call__(self, frame, t):
+        if self.right is not None and self.skipped + 1 < self.every:
+            self.skipped += 1
+            return landmarks.Detection(self.smoother.predict(t), self.right)
+
+        start = time.perf_counter()
+        detection = self.detector(frame, t)
+        elapsed = time.perf_counter() - start
+        self.detect_time = elapsed if self.detect_time is None else 0.9 * self.detect_time + 0.1 * elapsed
+        self.skipped = 0
+        if self.adaptive:
+            self.every = min(self.max_every, max(1, math.ceil(self.detect_time * self.target_fps)))
+
+        if not detection.count:
+            self.smoother.reset()
+            self.right = None
+            return detection
+        if self.right is not None and len(self.right) != detection.count:
+            self.smoother.reset()  # Hands came or went, old state doesn't line up any more
+        elif self.right is not None and detection.count > 1:
+            # mediapipe doesn't keep the hand order, line the hands up with the filtered ones
+            order = np.argsort(landmarks.match(self.smoother.x.mean(axis=1), detection.points.mean(axis=1)))
+            detection = landmarks.Detection(detection.points[order], detection.right[order])
+        self.right = detection.right
+        return landmarks.Detection(self.smoother(detection.points, t), detection.right)
@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+PRIMARY = "main"  # Alias for the first window of whatever mode is running
+BOUNDARY = b"frame"
+
+
+class Stream:
+    # Latest JPEG of one window. seq goes up with every new image; clients wait on cond.
+    def __init__(self, name):
+        self.name = name
+        self.cond = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.clients = 0
+        self.busy = False  # An encode is queued or running, further frames are dropped
+        self.pending = None  # Copy of the frame being encoded
+        self.encoded = None  # Frame behind the current JPEG, to spot unchanged frames
+        self.dropped = 0
+        self.unchanged = 0
+
+
+class StreamHub:
+    # Streams the windows of the render loop to any number of browsers as MJPEG.
+    # publish() is called from the render loop and only copies frames of watched windows into
+    # a per-window buffer; the JPEG encoding runs in a thread pool and is skipped when the
+    # frame didn't change. A window whose previous frame is still being encoded drops the new
+    # one, and every client only ever gets the newest JPEG, so slow viewers skip frames
+    # instead of queueing them and never hold up the render loop.
+    def __init__(self, workers=2, quality=80):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jpeg")
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.streams = {}
+        self.views = []  # Window names of the last published frame
+        self.clients = 0
+        self.lock = threading.Lock()
+        self.running = True
+
+    def _stream(self, name):
+        with self.lock:
+            stream = self.streams.get(name)
+            if stream is None:
+                stream = self.streams[name] = Stream(name)
+            return stream
+
+    def publish(self, views):
+        if not self.clients or not self.running:
+            return
+        self.views = list(views)
+        if views:
+            views = dict(views)
+            views[PRIMARY] = views[self.views[0]]
+        for name, img in views.items():
+            stream = self.streams.get(name)
+            if stream is None or not stream.clients:
+                continue
+            if stream.busy:
+                stream.dropped += 1
+                continue
+            if stream.pending is None or stream.pending.shape != img.shape:
+                stream.pending = np.empty_like(img)
+            np.copyto(stream.pending, img)
+            stream.busy = True
+            self.pool.submit(self._encode, stream)
+
+    def _encode(self, stream):
+        try:
+            frame = stream.pending
+            if stream.encoded is not None and np.array_equal(frame, stream.encoded):
+                stream.unchanged += 1
+                return
+            success, buffer = cv2.imencode(".jpg", frame, self.params)
+            if not success:
+                return
+            with stream.cond:
+                stream.jpeg = buffer.tobytes()
+                stream.seq += 1
+                stream.cond.notify_all()
+            stream.pending, stream.encoded = stream.encoded, frame
+        finally:
+            stream.busy = False
+
+    def mjpeg(self, name=PRIMARY, keepalive=2.0):
+        # multipart/x-mixed-replace body for one client. Without new frames the last JPEG is
+        # resent every keepalive seconds, which is also how a closed connection gets noticed.
+        stream = self._stream(name)
+        with self.lock:
+            stream.clients += 1
+            self.clients += 1
+        try:
+            seq = 0
+            while self.running:
+                with stream.cond:
+                    stream.cond.wait_for(lambda: stream.seq != seq or not self.running, keepalive)
+                    seq, jpeg = stream.seq, stream.jpeg
+                if jpeg is None or not self.running:
+                    continue
+                yield (b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                       + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+        finally:
+            with self.lock:
+                stream.clients -= 1
+                self.clients -= 1
+
+    def status(self):
+        with self.lock:
+            return {name: {"clients": s.clients, "frames": s.seq, "dropped": s.dropped, "unchanged": s.unchanged}
+                    for name, s in self.streams.items()}
+
+    def close(self):
+        self.running = False
+        for stream in list(self.streams.values()):
+            with stream.cond:
+                stream.cond.notify_all()
+        self.pool.shutdown(wait=False)
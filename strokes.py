@@ -0,0 +1,263 @@
+import math
+from collections import OrderedDict, namedtuple
+
+import cv2
+import numpy as np
+
+from autosave import StrokeLog
+from compositor import draw_shape
+
+# One drawing operation in canvas (world) coordinates. points is a float32 (n, 2) array: the
+# simplified polyline for Free Draw, start and end point for Line, Rectangle and Circle.
+# thickness is in world units too, so strokes scale with the zoom.
+Stroke = namedtuple("Stroke", ["tool", "color", "thickness", "points"])
+
+TOOLS = ("Free Draw", "Line", "Rectangle", "Circle")
+
+# Per-stroke fields of a saved canvas; the bounds are stored so a restored canvas can be
+# indexed without touching the points
+STROKE_FIELDS = [("tool", "u1"), ("color", "u1", (3,)), ("thickness", "<f4"), ("bounds", "<f4", (4,))]
+
+
+def stroke_log(path):
+    return StrokeLog(path, STROKE_FIELDS, np.float32)
+
+
+def rdp(points, epsilon=1.0):
+    # Ramer-Douglas-Peucker: keeps the points that deviate more than epsilon from the
+    # simplified polyline. Iterative, with the distances of each span computed at once.
+    points = np.asarray(points, np.float32)
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        a, b = spans.pop()
+        if b - a < 2:
+            continue
+        p, d = points[a], points[b] - points[a]
+        rest = points[a + 1:b] - p
+        norm = math.hypot(d[0], d[1])
+        if norm == 0:
+            dist = np.hypot(rest[:, 0], rest[:, 1])
+        else:
+            dist = np.abs(d[0] * rest[:, 1] - d[1] * rest[:, 0]) / norm
+        i = int(dist.argmax())
+        if dist[i] > epsilon:
+            m = a + 1 + i
+            keep[m] = True
+            spans += [(a, m), (m, b)]
+    return points[keep]
+
+
+def stroke_bounds(stroke):
+    # World bounding box (x0, y0, x1, y1) including the line width
+    pad = stroke.thickness / 2 + 1
+    points = stroke.points
+    if stroke.tool == "Circle":
+        radius = float(np.hypot(*(points[1] - points[0])))
+        (cx, cy), r = points[0], radius + pad
+        return cx - r, cy - r, cx + r, cy + r
+    return (float(points[:, 0].min()) - pad, float(points[:, 1].min()) - pad,
+            float(points[:, 0].max()) + pad, float(points[:, 1].max()) + pad)
+
+
+def draw_strokes(img, strokes, x, y, zoom):
+    # Rasterize strokes into img, whose top-left corner is world point (x, y), at zoom pixels per unit
+    for stroke in strokes:
+        points = np.round((stroke.points - (x, y)) * zoom).astype(np.int32)
+        thickness = max(1, int(round(stroke.thickness * zoom)))
+        if stroke.tool == "Free Draw":
+            if len(points) == 1:
+                cv2.line(img, tuple(points[0].tolist()), tuple(points[0].tolist()), stroke.color, thickness)
+            else:
+                cv2.polylines(img, [points], False, stroke.color, thickness)
+        else:
+            draw_shape(img, stroke.tool, tuple(points[0].tolist()), tuple(points[1].tolist()), stroke.color,
+                       thickness)
+    return img
+
+
+class StrokeCanvas:
+    # Unbounded drawing kept as a list of vector strokes, viewed through a pannable, zoomable
+    # window. Strokes are bucketed into world cells so a region only looks at the strokes
+    # that can touch it. The view is rasterized from screen tiles of `tile` pixels that are
+    # rendered on demand and kept in an LRU of at most max_tiles; tiles without ink are never
+    # stored, so memory follows the inked area that is on screen, not the canvas size.
+    def __init__(self, tile=256, cell=256, max_tiles=64):
+        self.tile = tile
+        self.cell = cell  # World size of an index cell
+        self.max_tiles = max_tiles
+        self.strokes = []
+        self.redoStack = []
+        self.cells = {}  # (cx, cy) -> indices of the strokes crossing that cell, in drawing order
+        self.bounds = []  # World box of each stroke
+        self.items = []  # (saved fields, points) of each stroke, see snapshot()
+        self.tiles = OrderedDict()  # (zoom, tx, ty) -> rendered tile
+        self.x, self.y, self.zoom = 0.0, 0.0, 1.0  # World point at the top-left of the view, pixels per unit
+        self.version = 0  # Bumped on every change of the strokes or the view
+
+    # View
+
+    def to_world(self, px, py):
+        return self.x + px / self.zoom, self.y + py / self.zoom
+
+    def pan(self, dx, dy):
+        # Move the view by a screen-space offset
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self.version += 1
+
+    def zoom_at(self, factor, px, py):
+        # Zoom around a screen point, which stays where it is
+        wx, wy = self.to_world(px, py)
+        self.zoom = min(8.0, max(0.125, self.zoom * factor))
+        self.x, self.y = wx - px / self.zoom, wy - py / self.zoom
+        self.version += 1
+
+    def reset_view(self):
+        self.x, self.y, self.zoom = 0.0, 0.0, 1.0
+        self.version += 1
+
+    # Strokes
+
+    def _cells(self, box):
+        c = self.cell
+        x0, y0, x1, y1 = box
+        return [(cx, cy) for cy in range(math.floor(y0 / c), math.floor(y1 / c) + 1)
+                for cx in range(math.floor(x0 / c), math.floor(x1 / c) + 1)]
+
+    def add(self, stroke, keep_redo=False, box=None):
+        box = stroke_bounds(stroke) if box is None else box
+        index = len(self.strokes)
+        self.strokes.append(stroke)
+        self.bounds.append(box)
+        self.items.append(((TOOLS.index(stroke.tool), stroke.color, stroke.thickness, box), stroke.points))
+        for key in self._cells(box):
+            self.cells.setdefault(key, []).append(index)
+        if not keep_redo:
+            self.redoStack = []
+        self._invalidate(box)
+        self.version += 1
+
+    def _pop(self):
+        stroke, box = self.strokes.pop(), self.bounds.pop()
+        self.items.pop()
+        self.version += 1
+        for key in self._cells(box):
+            indices = self.cells[key]
+            indices.pop()  # The last stroke is always last in its cells
+            if not indices:
+                del self.cells[key]
+        self._invalidate(box)
+        return stroke
+
+    def undo(self):
+        if not self.strokes:
+            return False
+        self.redoStack.append(self._pop())
+        return True
+
+    def redo(self):
+        if not self.redoStack:
+            return False
+        self.add(self.redoStack.pop(), keep_redo=True)
+        return True
+
+    def clear(self):
+        self.strokes, self.bounds, self.items, self.cells, self.redoStack = [], [], [], {}, []
+        self.tiles.clear()
+        self.version += 1
+
+    # Persistence
+
+    def snapshot(self):
+        # Arguments for StrokeLog.write, cheap enough to take on the frame loop (strokes are
+        # never modified, so copying the list is enough)
+        return list(self.items), {"view": [self.x, self.y, self.zoom]}
+
+    def restore(self, log):
+        # Only the index is read here; each stroke's points are memory-mapped and come off
+        # the disk when a tile that shows the stroke is first rendered
+        meta, records, points = log.read()
+        self.clear()
+        for record in records:
+            offset, count = int(record["offset"]), int(record["count"])
+            stroke = Stroke(TOOLS[int(record["tool"])], tuple(record["color"].tolist()), float(record["thickness"]),
+                            points[offset:offset + count])
+            self.add(stroke, box=tuple(record["bounds"].tolist()))
+        log.prime([stroke.points for stroke in self.strokes], records["offset"])
+        self.x, self.y, self.zoom = meta.get("view", (0.0, 0.0, 1.0))
+        return self
+
+    def query(self, x0, y0, x1, y1):
+        # Strokes whose box meets the world rectangle, in drawing order
+        found = set()
+        for key in self._cells((x0, y0, x1, y1)):
+            found.update(self.cells.get(key, ()))
+        hits = []
+        for i in sorted(found):
+            bx0, by0, bx1, by1 = self.bounds[i]
+            if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                hits.append(self.strokes[i])
+        return hits
+
+    # Rendering
+
+    def _invalidate(self, box):
+        x0, y0, x1, y1 = box
+        for key in list(self.tiles):
+            zoom, tx, ty = key
+            size = self.tile / zoom
+            if tx * size <= x1 and (tx + 1) * size >= x0 and ty * size <= y1 and (ty + 1) * size >= y0:
+                del self.tiles[key]
+
+    def _tile(self, zoom, tx, ty):
+        key = (zoom, tx, ty)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        size = self.tile / zoom
+        x, y = tx * size, ty * size
+        strokes = self.query(x, y, x + size, y + size)
+        if not strokes:
+            return None
+        img = draw_strokes(np.zeros((self.tile, self.tile, 3), np.uint8), strokes, x, y, zoom)
+        self.tiles[key] = img
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return img
+
+    def render_view(self, img):
+        # Draw the current view into img (which is cleared first) from cached tiles
+        img[:] = 0
+        height, width = img.shape[:2]
+        t, zoom = self.tile, self.zoom
+        # Tiles are aligned to the world grid at this zoom, px is where the view starts in it
+        px, py = self.x * zoom, self.y * zoom
+        for ty in range(math.floor(py / t), math.floor((py + height) / t) + 1):
+            for tx in range(math.floor(px / t), math.floor((px + width) / t) + 1):
+                tile = self._tile(zoom, tx, ty)
+                if tile is None:
+                    continue
+                # Screen position of the tile, clipped to the view
+                sx, sy = int(round(tx * t - px)), int(round(ty * t - py))
+                x0, y0, x1, y1 = max(sx, 0), max(sy, 0), min(sx + t, width), min(sy + t, height)
+                if x0 < x1 and y0 < y1:
+                    img[y0:y1, x0:x1] = tile[y0 - sy:y1 - sy, x0 - sx:x1 - sx]
+        return img
+
+    def render(self, x0, y0, x1, y1, width, height=None):
+        # Rasterize a world rectangle at any resolution (export), independent of the tile cache
+        zoom = width / (x1 - x0)
+        height = height or int(round((y1 - y0) * zoom))
+        img = np.zeros((height, width, 3), np.uint8)
+        return draw_strokes(img, self.query(x0, y0, x1, y1), x0, y0, zoom)
+
+    def extent(self):
+        # World box around all strokes, None for an empty canvas
+        if not self.bounds:
+            return None
+        boxes = np.array(self.bounds)
+        return boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()
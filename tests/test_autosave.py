@@ -0,0 +1,86 @@
+import numpy as np
+
+from annotations import AnnotationStore
+from autosave import StrokeLog
+from strokes import Stroke, StrokeCanvas, stroke_log
+
+
+def line(x, n=50):
+    return np.stack([np.full(n, x, np.float32), np.arange(n, dtype=np.float32) * 4], axis=1)
+
+
+def canvas_points(canvas):
+    return [np.array(stroke.points) for stroke in canvas.strokes]
+
+
+def test_canvas_restore_undo_write_redo(tmp_path):
+    # Restored strokes are views into the points file; writing after an undo must not
+    # truncate it under them (SIGBUS on render) or overwrite them (redone strokes read back
+    # someone else's points)
+    path = str(tmp_path / "canvas")
+    canvas = StrokeCanvas()
+    for x in (10, 20, 30):
+        canvas.add(Stroke("Free Draw", (255, 0, 0), 4.0, line(x)))
+    expected = canvas_points(canvas)
+    stroke_log(path).write(*canvas.snapshot())
+
+    log = stroke_log(path)
+    restored = StrokeCanvas().restore(log)
+    restored.undo()
+    restored.undo()
+    log.write(*restored.snapshot())
+    restored.redo()
+    restored.redo()
+    restored.render_view(np.zeros((720, 1280, 3), np.uint8))
+    for a, b in zip(canvas_points(restored), expected):
+        np.testing.assert_array_equal(a, b)
+    restored.add(Stroke("Line", (0, 255, 0), 2.0, np.float32([[0, 0], [100, 100]])))
+    log.write(*restored.snapshot())
+    expected.append(np.float32([[0, 0], [100, 100]]))
+
+    reloaded = StrokeCanvas().restore(stroke_log(path))
+    assert len(reloaded.strokes) == 4
+    for a, b in zip(canvas_points(reloaded), expected):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_annotations_add_on_earlier_slide(tmp_path):
+    path = str(tmp_path / "slides")
+    store = AnnotationStore((640, 360))
+    for slide, x in ((0, 10), (1, 200)):
+        for y in range(0, 100, 10):
+            store[slide].add_point((x, y))
+        store[slide].end_stroke()
+    store.save(path)
+    later = np.array(store[1].strokes[0])
+
+    loaded = AnnotationStore((640, 360)).load(path)
+    for y in range(0, 100, 10):
+        loaded[0].add_point((50, y))
+    loaded[0].end_stroke()
+    loaded.save(path, loaded.snapshot())
+    np.testing.assert_array_equal(loaded[1].strokes[0], later)
+
+    reloaded = AnnotationStore((640, 360)).load(path)
+    assert len(reloaded[0].strokes) == 2
+    np.testing.assert_array_equal(reloaded[1].strokes[0], later)
+
+
+def test_compaction_keeps_restored_views(tmp_path):
+    path = str(tmp_path / "log")
+    log = StrokeLog(path, [("slide", "<i4")], np.int16, compact_min=0)
+    strokes = [np.full((100, 2), i, np.int16) for i in range(4)]
+    log.write([((0,), s) for s in strokes])
+    _, records, points = log.read()
+    views = [points[r["offset"]:r["offset"] + r["count"]] for r in records]
+    log.prime(views, records["offset"])
+
+    for _ in range(2):  # Undo and draw again until the undone points outweigh the live ones
+        views = views[:1] + [np.full((100, 2), 9, np.int16)]
+        log.write([((0,), s) for s in views])
+    assert log.points_name != "points.0.bin"
+    np.testing.assert_array_equal(views[0], strokes[0])
+
+    _, records, points = StrokeLog(path, [("slide", "<i4")], np.int16).read()
+    assert len(points) == 200
+    np.testing.assert_array_equal(points[records[0]["offset"]:][:100], strokes[0])
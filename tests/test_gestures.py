@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+import landmarks
+from gestures import GestureEngine, Pose, Swipe
+
+SIZE = (1000, 1000)
+FPS = 30
+
+
+def hand(fingers, x=500, y=500):
+    # Landmarks of one left hand with the index tip at pixel (x, y); fingers is thumb..pinky, 1 up
+    points = np.zeros((21, 3), np.float32)
+    points[:, 0], points[:, 1] = (x + 0.5) / SIZE[0], (y + 0.5) / SIZE[1]
+    for finger, tip in enumerate(landmarks.TIPS.tolist()):
+        if finger == 0:
+            points[landmarks.THUMB_IP, 0] = points[tip, 0] - (0.01 if fingers[0] else -0.01)
+        else:
+            points[tip - 2, 1] = points[tip, 1] + (0.02 if fingers[finger] else -0.02)
+    return points
+
+
+def detection(*hands):
+    return landmarks.Detection(np.array(hands, np.float32).reshape(-1, 21, 3), np.zeros(len(hands), bool))
+
+
+def run(engine, frames):
+    # frames: [(t, Detection)], returns every Event in order
+    events = []
+    for t, frame in frames:
+        events += engine.update(frame, t, SIZE)
+    return events
+
+
+def test_hold_fires_once_after_hold():
+    engine = GestureEngine([Pose("open", count=5, hold=0.5)])
+    frames = [(k / FPS, detection(hand((0, 0, 0, 0, 0)))) for k in range(3)]
+    frames += [(k / FPS, detection(hand((1, 1, 1, 1, 1)))) for k in range(3, 40)]
+    events = run(engine, frames)
+    assert [event.t for event in events] == [18 / FPS]  # First frame at least 0.5 s after 3 / FPS
+    assert events[0].latency == pytest.approx(0.5)
+    assert engine.holding("open")
+
+
+def test_repeat_while_held():
+    engine = GestureEngine([Pose("point", fingers=(None, 1, 0, 0, 0), repeat=0.1)])
+    frames = [(k * 0.05, detection(hand((0, 1, 0, 0, 0)))) for k in range(8)]
+    events = run(engine, frames)
+    assert [event.t for event in events] == pytest.approx([0.0, 0.1, 0.2, 0.3])
+    assert [event.repeat for event in events] == [False, True, True, True]
+
+
+def test_condition_break_rearms():
+    engine = GestureEngine([Pose("fist", count=0)])
+    fist, open_hand = detection(hand((0, 0, 0, 0, 0))), detection(hand((1, 1, 1, 1, 1)))
+    events = run(engine, [(0.0, fist), (0.1, fist), (0.2, open_hand), (0.3, fist)])
+    assert [event.t for event in events] == [0.0, 0.3]
+
+
+def test_cooldown_blocks_group():
+    engine = GestureEngine([Pose("a", count=(1, 5), cooldown=0.3, group="g"), Pose("b", count=(1, 5), group="g")])
+    frames = [(k / FPS, detection(hand((0, 1, 0, 0, 0)))) for k in range(15)]
+    events = run(engine, frames)
+    assert [(event.name, event.t) for event in events] == [("a", 0.0), ("b", 9 / FPS)]
+
+
+def test_frame_scope_counts_all_hands():
+    engine = GestureEngine([Pose("quit", count=(8, 10), scope="frame")])
+    one = detection(hand((1, 1, 1, 1, 1)))
+    two = detection(hand((1, 1, 1, 1, 1)), hand((1, 1, 1, 1, 1), x=200))
+    events = run(engine, [(0.0, one), (0.1, two)])
+    assert [(event.hand, event.t) for event in events] == [(None, 0.1)]
+
+
+def swipe_frames(xs, start=0):
+    return [((start + k) / FPS, detection(hand((0, 1, 0, 0, 0), x=x))) for k, x in enumerate(xs)]
+
+
+def test_swipe_fires_on_first_fast_frame_after_drift():
+    # Slow drift right before a flick must not water down the flick's speed
+    engine = GestureEngine([Swipe("right", "right", distance=50, velocity=1000)])
+    drift = [100 + 6 * k for k in range(20)]
+    flick = [drift[-1] + 64 * k for k in range(1, 6)]
+    events = run(engine, swipe_frames(drift + flick))
+    assert events[0].t == 20 / FPS
+    assert events[0].latency == pytest.approx(1 / FPS)
+
+
+def test_slow_motion_never_swipes():
+    engine = GestureEngine([Swipe("right", "right", distance=50, velocity=1000)])
+    assert run(engine, swipe_frames([100 + 6 * k for k in range(60)])) == []
+
+
+def test_swipe_rearms_after_cooldown():
+    engine = GestureEngine([Swipe("right", "right", distance=50, velocity=1000, cooldown=0.3)])
+    events = run(engine, swipe_frames([100 + 40 * k for k in range(20)]))
+    times = [event.t for event in events]
+    assert times[0] == 2 / FPS  # 80 px in two frames
+    # The next swipe is measured from after the first one and waits out the cooldown
+    assert times[1] >= times[0] + 0.3
+    assert len(times) == 2
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import numpy as np
+
+import modes
+from governor import QualityGovernor
+from metrics import metrics
+from pipeline import Pipeline, open_source, run
+
+
+class Worker:
+    # Resident process behind app.py. The camera and one hand model per mode are opened once
+    # and kept; starting a mode only builds the (cheap) mode object and a pipeline around the
+    # already loaded tracker. serve() is the render loop and has to run on the main thread
+    # (cv2 windows); start/stop/status are called from the web server's threads.
+    # Every frame's windows are also handed to hub (a streaming.StreamHub) when one is given.
+    # Each session gets a QualityGovernor (AIR_CANVAS_TARGET_FPS) whose level is in status().
+    def __init__(self, source=0, width=1280, height=720, preload=None, hub=None):
+        self.spec = source
+        self.hub = hub
+        self.size = (width, height)
+        self.preload = list(modes.MODES) if preload is None else preload
+        self.source = None
+        self.trackers = {}
+        self.load_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.running = True
+        self.requested = None  # Mode the web side asked for, None when idle
+        self.requested_at = None
+        self.current = None  # Mode the render loop is running
+        self.pipeline = None
+        self.governor = None
+        self.started = None
+        self.switch_ms = None  # Start request to running pipeline for the last switch
+        self.error = None
+
+    def warm_up(self):
+        # Opens the camera and loads the hand models in the background so the first start is fast
+        thread = threading.Thread(target=self._warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        try:
+            self._source()
+            for name in self.preload:
+                self._tracker(name)
+        except Exception as e:
+            self.error = "warm-up: %s" % e
+
+    def _source(self):
+        with self.load_lock:
+            if self.source is None:
+                self.source = open_source(self.spec, *self.size)
+            return self.source
+
+    def _tracker(self, name):
+        with self.load_lock:
+            tracker = self.trackers.get(name)
+            if tracker is None:
+                _, create_tracker = modes.load(name)
+                tracker = create_tracker()
+                # mediapipe builds its graph on the first frame, pay for that now
+                tracker(np.zeros((self.size[1], self.size[0], 3), np.uint8), 0.0)
+                self.trackers[name] = tracker
+            return tracker
+
+    def start(self, name):
+        # Switches to mode `name`; returns False if it is already running or starting
+        if name not in modes.MODES:
+            raise KeyError(name)
+        with self.cond:
+            if self.requested == name:
+                return False
+            self.requested = name
+            self.requested_at = time.monotonic()
+            self.error = None
+            pipeline = self.pipeline
+            self.cond.notify()
+        if pipeline is not None:
+            pipeline.stop()  # The render loop picks up the new mode as soon as this one ends
+        return True
+
+    def stop(self):
+        with self.cond:
+            self.requested = None
+            pipeline = self.pipeline
+        if pipeline is not None:
+            pipeline.stop()
+
+    def status(self):
+        with self.cond:
+            return {
+                "mode": self.current,
+                "requested": self.requested,
+                "modes": sorted(modes.MODES),
+                "loaded": sorted(self.trackers),
+                "uptime_s": time.monotonic() - self.started if self.current else 0.0,
+                "switch_ms": self.switch_ms,
+                "fps": metrics.fps if self.current else 0.0,
+                "quality": self.governor.status() if self.governor is not None else None,
+                "error": self.error,
+            }
+
+    def serve(self):
+        while True:
+            with self.cond:
+                while self.running and self.requested is None:
+                    self.cond.wait()
+                if not self.running:
+                    break
+                name, requested_at = self.requested, self.requested_at
+            try:
+                self._run(name, requested_at)
+            except Exception as e:
+                self.error = "%s: %s" % (name, e)
+            with self.cond:
+                self.current = self.pipeline = self.governor = None
+                if self.requested == name:
+                    self.requested = None  # The mode ended by itself ('q', gesture) or failed
+        if self.source is not None:
+            self.source.release()
+
+    def _run(self, name, requested_at):
+        tracker = self._tracker(name)
+        tracker.reset()  # No ROI box or smoothing state carried over from the last session
+        mode = modes.create(name)
+        source = self._source()
+        source.size = mode.size  # None keeps the camera's own resolution
+        pipeline = Pipeline(source, tracker, release=False)
+        with self.cond:
+            if self.requested != name:  # Switched away while the mode was being built
+                mode.close()
+                return
+            # Every session starts at full quality, the governor also undoes the last one's settings
+            self.governor = QualityGovernor.from_env(pipeline)
+            self.current, self.pipeline = name, pipeline
+            self.started = time.monotonic()
+            self.switch_ms = (self.started - requested_at) * 1000
+        metrics.reset()
+        run(mode, pipeline, on_frame=self.hub.publish if self.hub is not None else None, governor=self.governor)
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.requested = None
+            pipeline = self.pipeline
+            self.cond.notify()
+        if pipeline is not None:
+            pipeline.stop()